@@ -0,0 +1,56 @@
+import io
+
+import discord
+import numpy as np
+from scipy.io.wavfile import write
+from scipy.signal import resample_poly
+
+from vits.instrumentation import instrumentation
+
+TTS_SAMPLE_RATE = 22050
+DISCORD_SAMPLE_RATE = 48000
+# 20 ms of 16-bit stereo PCM at 48 kHz, the frame size discord expects
+FRAME_SIZE = DISCORD_SAMPLE_RATE // 50 * 2 * 2
+
+
+def to_int16(audio_data):
+    # same scaling as save_audio, so played and exported audio match
+    return ((audio_data / 1.414) * 32767).astype(np.int16)
+
+
+def wav_bytes(audio_data):
+    buffer = io.BytesIO()
+    with instrumentation.stage("encode", samples=len(audio_data)):
+        write(buffer, TTS_SAMPLE_RATE, to_int16(audio_data))
+    buffer.seek(0)
+    return buffer
+
+
+class NumpyPCMAudio(discord.AudioSource):
+    """Plays synthesizer output without temp files or an ffmpeg process.
+
+    The float32 22050 Hz mono array is resampled to 48 kHz in-process,
+    duplicated to stereo and handed to discord in 20 ms frames.
+    """
+
+    def __init__(self, audio_data, sample_rate=TTS_SAMPLE_RATE):
+        with instrumentation.stage("encode", samples=len(audio_data)):
+            audio = resample_poly(audio_data, DISCORD_SAMPLE_RATE, sample_rate)
+            audio = np.repeat(to_int16(np.clip(audio, -1.414, 1.414))[:, None], 2, axis=1)
+        self._pcm = audio.tobytes()
+        self._pos = 0
+
+    def read(self):
+        frame = self._pcm[self._pos : self._pos + FRAME_SIZE]
+        self._pos += FRAME_SIZE
+        if not frame:
+            return b""
+        # the last frame has to be padded to full length
+        return frame.ljust(FRAME_SIZE, b"\0")
+
+    def is_opus(self):
+        return False
+
+    @property
+    def duration(self):
+        return len(self._pcm) / (DISCORD_SAMPLE_RATE * 2 * 2)
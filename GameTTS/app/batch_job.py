@@ -0,0 +1,162 @@
+import queue
+import threading
+
+
+class BatchLine:
+    def __init__(self, idx, text, speaker_id, speaker_name):
+        self.idx = idx
+        self.text = text
+        self.speaker_id = str(speaker_id)
+        self.speaker_name = speaker_name
+        self.text_seqs = []
+        self.audios = []
+        self.remaining = 0
+
+
+def parse_lines(lines, synthesizer, default_speaker_id, default_speaker_name):
+    """Turns the lines of an input file ("text" or "text|speaker id") into
+    BatchLines, empty lines are skipped"""
+    batch_lines = []
+    for line in lines:
+        if not line.strip():
+            continue
+        if len(line.split("|")) > 1:
+            text, sp_id = line.split("|")
+            sp_id = sp_id.strip()
+            sp_name = synthesizer.get_speaker_by_id(sp_id)
+        else:
+            text, sp_id, sp_name = line, default_speaker_id, default_speaker_name
+        batch_lines.append(BatchLine(len(batch_lines), text, sp_id, sp_name))
+    return batch_lines
+
+
+class BatchJob:
+    """Synthesizes the lines of an input file as one job.
+
+    Lines are segmented and their sentences phonemized one line at a time
+    on the calling thread, or for inputs of at least min_frontend_lines
+    lines in the worker processes of frontend (a TextFrontend), whose
+    results arrive while inference runs. The first line is synthesized as
+    soon as it is phonemized, after that every window of about window
+    sentences is batched by speaker through the synthesizer's length-bucket
+    scheduler. Finished lines are handed to a writer thread, which runs
+    write_fn(line, audio) (encoding and export) while the next batch is
+    computed. on_done(line, result) receives the
+    return value of write_fn; it is always called from the thread calling
+    run, so it may talk to the UI.
+
+    With a seed in speech_param every line is synthesized on its own, so
+    the result matches the single text synthesis with the same seed.
+    """
+
+    min_frontend_lines = 16
+
+    def __init__(self, synthesizer, speech_param, write_fn, on_done, frontend=None, window=32):
+        self.synthesizer = synthesizer
+        self.speech_param = speech_param
+        self.write_fn = write_fn
+        self.on_done = on_done
+        self.frontend = frontend
+        self.window = window
+
+        self._write_queue = queue.Queue()
+        self._done_queue = queue.Queue()
+        self._writer_error = None
+
+    def run(self, batch_lines):
+        writer = threading.Thread(target=self._write, name="BatchJobWriter", daemon=True)
+        writer.start()
+        try:
+            if self.speech_param.get("seed") is not None:
+                self._run_seeded(batch_lines)
+            else:
+                self._run_batched(batch_lines)
+        finally:
+            self._write_queue.put(None)
+            writer.join()
+            self._report_done()
+
+        if self._writer_error is not None:
+            raise self._writer_error
+
+    def _run_seeded(self, batch_lines):
+        for line in batch_lines:
+            audio = self.synthesizer.synthesize(
+                line.text, line.speaker_id, self.speech_param, seed=self.speech_param["seed"]
+            )
+            self._write_queue.put((line, audio))
+            self._report_done()
+
+    def _text_seqs(self, batch_lines):
+        if self.frontend is not None and len(batch_lines) >= self.min_frontend_lines:
+            return self.frontend.map([line.text for line in batch_lines])
+
+        return self._phonemize(batch_lines)
+
+    def _phonemize(self, batch_lines):
+        # gruut and pysbd hold the GIL, so phonemizing on threads would not
+        # run in parallel. Lazily, so inference starts after the first line.
+        for line in batch_lines:
+            seg_text = self.synthesizer.segmenter.segment(line.text)
+            yield [self.synthesizer.get_text(sentence) for sentence in seg_text]
+
+    def _run_batched(self, batch_lines):
+        groups = {}
+        n_pending = 0
+        first = True
+        for line, text_seqs in zip(batch_lines, self._text_seqs(batch_lines)):
+            line.text_seqs = text_seqs
+            line.audios = [None] * len(text_seqs)
+            line.remaining = len(text_seqs)
+            if not text_seqs:
+                self._write_queue.put((line, self.synthesizer.join_sentences([])))
+            for sent_idx, seq in enumerate(text_seqs):
+                groups.setdefault(line.speaker_id, []).append((line, sent_idx, seq))
+
+            n_pending += len(text_seqs)
+            if n_pending >= self.window or (first and n_pending):
+                self._infer_groups(groups)
+                groups = {}
+                n_pending = 0
+                first = False
+        self._infer_groups(groups)
+
+    def _infer_groups(self, groups):
+        synthesizer = self.synthesizer
+        scheduler = synthesizer.scheduler
+        for speaker_id, sentences in groups.items():
+            lengths = [seq.size(0) for _, _, seq in sentences]
+            for batch in scheduler.schedule(lengths):
+                audios = synthesizer.infer_batch(
+                    [sentences[i][2] for i in batch], speaker_id, self.speech_param
+                )
+                scheduler.record([lengths[i] for i in batch])
+                for i, audio in zip(batch, audios):
+                    line, sent_idx, _ = sentences[i]
+                    line.audios[sent_idx] = audio
+                    line.remaining -= 1
+                    if line.remaining == 0:
+                        self._write_queue.put((line, synthesizer.join_sentences(line.audios)))
+                        line.audios = []
+                self._report_done()
+
+    def _write(self):
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                return
+            if self._writer_error is not None:
+                continue
+            line, audio = item
+            try:
+                self._done_queue.put((line, self.write_fn(line, audio)))
+            except Exception as err:
+                self._writer_error = err
+
+    def _report_done(self):
+        while True:
+            try:
+                line, result = self._done_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.on_done(line, result)
@@ -0,0 +1,86 @@
+import json
+import time
+from pathlib import Path
+
+GAMES = {0: "gothic", 1: "risen", 2: "skyrim", 3: "witcher"}
+
+
+class SpeakerIndex:
+    """In-memory speaker catalogue for autocompletion.
+
+    Every speaker is listed as "name (Game, id)". All substrings of up to
+    ngram_size characters of the lowercased label map to the matching
+    speaker positions, so a query is answered by a dictionary lookup (short
+    queries) or an intersection of n-gram sets plus a final substring check
+    (longer queries). The mapping files are re-read only when their mtime
+    changes, checked at most every check_interval seconds.
+    """
+
+    def __init__(self, mapping_folder, ngram_size=3, check_interval=1.0):
+        self.mapping_folder = Path(mapping_folder)
+        self.ngram_size = ngram_size
+        self.check_interval = check_interval
+
+        self.speakers = []
+        self._labels = []
+        self._ngrams = {}
+        self._mtimes = None
+        self._last_check = 0.0
+        self._reload_if_changed(force=True)
+
+    def _mapping_files(self):
+        return [Path(self.mapping_folder, f"{i}_sorted.json") for i in GAMES]
+
+    def _reload_if_changed(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+
+        mtimes = [f.stat().st_mtime for f in self._mapping_files()]
+        if mtimes != self._mtimes:
+            self._mtimes = mtimes
+            self._build()
+
+    def _build(self):
+        speakers = []
+        for i, file_path in zip(GAMES, self._mapping_files()):
+            with open(file_path, "r") as f:
+                data = json.load(f)
+            for k, v in data.items():
+                speakers.append(
+                    {"name": f"{k} ({GAMES[i].capitalize()}, {v})", "value": int(v)}
+                )
+
+        labels = [s["name"].lower() for s in speakers]
+        ngrams = {}
+        for pos, label in enumerate(labels):
+            for n in range(1, self.ngram_size + 1):
+                for start in range(len(label) - n + 1):
+                    ngrams.setdefault(label[start : start + n], set()).add(pos)
+
+        # swap in one go, so concurrent queries never see a half built index
+        self.speakers, self._labels, self._ngrams = speakers, labels, ngrams
+
+    def search(self, query, limit=25):
+        self._reload_if_changed()
+        speakers, labels, ngrams = self.speakers, self._labels, self._ngrams
+
+        query = query.lower()
+        if not query:
+            return speakers[:limit]
+
+        n = self.ngram_size
+        if len(query) <= n:
+            positions = ngrams.get(query, set())
+        else:
+            grams = [query[i : i + n] for i in range(len(query) - n + 1)]
+            grams.sort(key=lambda g: len(ngrams.get(g, ())))
+            positions = set(ngrams.get(grams[0], ()))
+            for gram in grams[1:]:
+                if not positions:
+                    break
+                positions &= ngrams.get(gram, set())
+            positions = {pos for pos in positions if query in labels[pos]}
+
+        return [speakers[pos] for pos in sorted(positions)[:limit]]
@@ -1,11 +1,16 @@
 # import gdown
+import hashlib
+import os
 import platform
+import sys
 from pathlib import Path
 from scipy.io.wavfile import write
 from pydub import AudioSegment
 import numpy as np
 import requests
 
+from vits.instrumentation import instrumentation
+
 # init paths
 APP_FOLDER = Path(Path(__file__).parent.parent.resolve())
 APP_CONFIG_PATH = Path(APP_FOLDER, "static_web/resource/", "app-config.json")
@@ -14,9 +19,18 @@ SPEAKER_CONFIG = Path(
 )
 TTS_CONFIG_PATH = Path(APP_FOLDER, "vits/model", "config.json")
 TTS_MODEL_PATH = Path(APP_FOLDER, "vits/model", "G_600000.pth")
+CACHE_FOLDER = Path(APP_FOLDER, "cache")
+PHONEME_CACHE_PATH = Path(CACHE_FOLDER, "phonemes.sqlite")
+AUDIO_CACHE_PATH = Path(CACHE_FOLDER, "audio")
 
-MODEL_URLS = {
-    "G_600000.pth": "https://github.com/lexkoro/GameTTS/releases/download/v0.0.1/G_600000.pth",
+# sha256 of the release asset, checked after every download. It has to be
+# taken from the release; while it is None, download_model warns that the
+# file is unverified.
+MODEL_MANIFEST = {
+    "G_600000.pth": {
+        "url": "https://github.com/lexkoro/GameTTS/releases/download/v0.0.1/G_600000.pth",
+        "sha256": None,
+    },
 }
 
 # init platform
@@ -31,10 +45,76 @@ else:
     print("Unidentified system")
 
 
-def download_model(model_name):
-    url = MODEL_URLS[model_name]
-    r = requests.get(url, allow_redirects=True)
-    open(str(TTS_MODEL_PATH), "wb").write(r.content)
+def print_progress(done, total):
+    if total:
+        sys.stdout.write(f"\rDownloading model: {done / total:.0%} ({done >> 20}/{total >> 20} MB)")
+    else:
+        sys.stdout.write(f"\rDownloading model: {done >> 20} MB")
+    sys.stdout.flush()
+
+
+def download_file(url, file_path, sha256=None, chunk_size=1 << 20, progress=None, timeout=30):
+    """Streams url to file_path in chunks.
+
+    Data is written to file_path + ".part", an interrupted download is
+    resumed from there with an HTTP Range request. The file is checked
+    against sha256 (if given) and only then renamed to file_path, so
+    file_path either does not exist or is complete. progress is called
+    with (bytes done, total bytes or None) after every chunk.
+    """
+    file_path = Path(file_path)
+    part_path = file_path.with_name(file_path.name + ".part")
+    offset = part_path.stat().st_size if part_path.exists() else 0
+
+    digest = hashlib.sha256()
+    if offset:
+        with open(part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with requests.get(
+        url, headers=headers, stream=True, allow_redirects=True, timeout=timeout
+    ) as r:
+        # 416: the part file already holds the whole file
+        if r.status_code != 416:
+            r.raise_for_status()
+            if offset and r.status_code != 206:
+                # the server ignored the range, start over
+                offset = 0
+                digest = hashlib.sha256()
+            length = r.headers.get("Content-Length")
+            total = offset + int(length) if length is not None else None
+
+            done = offset
+            with open(part_path, "ab" if offset else "wb") as f:
+                for chunk in r.iter_content(chunk_size):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    done += len(chunk)
+                    if progress is not None:
+                        progress(done, total)
+                f.flush()
+                os.fsync(f.fileno())
+
+            if total is not None and done != total:
+                raise IOError(f"Download of {url} incomplete: {done} of {total} bytes")
+
+    if sha256 is not None and digest.hexdigest() != sha256.lower():
+        part_path.unlink()
+        raise ValueError(f"Checksum mismatch for {url}: got {digest.hexdigest()}")
+
+    os.replace(part_path, file_path)
+    return file_path
+
+
+def download_model(model_name, progress=print_progress):
+    entry = MODEL_MANIFEST[model_name]
+    if entry["sha256"] is None:
+        print(f"Warning: no checksum for {model_name} in MODEL_MANIFEST, the download is not verified")
+    download_file(entry["url"], TTS_MODEL_PATH, entry["sha256"], progress=progress)
+    if progress is print_progress:
+        print()
 
 
 def create_samples(synthesizer):
@@ -55,19 +135,20 @@ def save_audio(out_path, file_name, audio_data, file_ext="wav"):
     file_path = Path(out_path, ".".join([file_name, file_ext]))
     audio_data = ((audio_data / 1.414) * 32767).astype(np.int16)
 
-    if file_ext == "wav":
-        # save as wav 16-Bit PCM
-        write(file_path, 22050, audio_data)
-
-    elif file_ext == "ogg":
-        # save as ogg
-        AudioSegment(
-            audio_data.tobytes(),
-            sample_width=2,
-            frame_rate=22050,
-            channels=1,
-        ).export(file_path, format="ogg")
-    else:
-        raise f"Unrecognized File Extension  {file_ext}"
+    with instrumentation.stage("encode", samples=len(audio_data)):
+        if file_ext == "wav":
+            # save as wav 16-Bit PCM
+            write(file_path, 22050, audio_data)
+
+        elif file_ext == "ogg":
+            # save as ogg
+            AudioSegment(
+                audio_data.tobytes(),
+                sample_width=2,
+                frame_rate=22050,
+                channels=1,
+            ).export(file_path, format="ogg")
+        else:
+            raise f"Unrecognized File Extension  {file_ext}"
 
     return file_path
@@ -0,0 +1,46 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SynthesisWorker:
+    """Runs blocking synthesis calls on a thread pool so the asyncio event
+    loop (and with it the Discord heartbeat) is never blocked.
+
+    At most max_workers calls run at the same time. Requests of one guild
+    are queued and served in order, at most max_pending_per_guild of them may
+    wait at once before run raises asyncio.QueueFull.
+    """
+
+    def __init__(self, max_workers=4, max_pending_per_guild=5):
+        self.max_workers = max_workers
+        self.max_pending_per_guild = max_pending_per_guild
+
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="tts")
+        self._semaphore = None
+        self._guild_locks = {}
+        self._guild_pending = {}
+
+    async def run(self, guild_id, fn, *args, **kwargs):
+        if self._semaphore is None:
+            # created lazily so it binds to the running event loop
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+        if self._guild_pending.get(guild_id, 0) >= self.max_pending_per_guild:
+            raise asyncio.QueueFull(f"Too many pending requests for guild {guild_id}")
+
+        lock = self._guild_locks.setdefault(guild_id, asyncio.Lock())
+        self._guild_pending[guild_id] = self._guild_pending.get(guild_id, 0) + 1
+        try:
+            # asyncio.Lock wakes up waiters in FIFO order
+            async with lock:
+                async with self._semaphore:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(
+                        self._executor, functools.partial(fn, *args, **kwargs)
+                    )
+        finally:
+            self._guild_pending[guild_id] -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
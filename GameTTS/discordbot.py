@@ -7,14 +7,16 @@ import random
 from typing import List
 
 from app.utils import *
-import os
+from app.worker import SynthesisWorker
+from app.audio_source import NumpyPCMAudio, wav_bytes
+from app.speaker_index import SpeakerIndex
 import discord
 from discord import app_commands
-import wave
 import asyncio
 
 try:
     from vits.synthesizer import Synthesizer
+    from vits.engine import InferenceEngine
     synthesizer = Synthesizer(TTS_CONFIG_PATH)
     if TTS_MODEL_PATH.exists():
         synthesizer.load_model(TTS_MODEL_PATH)
@@ -22,6 +24,11 @@ try:
         download_model("G_600000.pth")
         synthesizer.load_model(TTS_MODEL_PATH)
     synthesizer.init_speaker_map(SPEAKER_CONFIG)
+    synthesizer.init_phoneme_cache(PHONEME_CACHE_PATH)
+    synthesizer.init_audio_cache(AUDIO_CACHE_PATH)
+    synthesizer.warm_speaker_cache()
+    # batches sentences of concurrent /tts calls into shared inference passes
+    engine = InferenceEngine(synthesizer).start()
 except ImportError as err:
     eel.call_torch_modal()  # call javascript modal if torch not available
 
@@ -53,27 +60,20 @@ class MyClient(discord.Client):
 
 intents = discord.Intents.default()
 client = MyClient(intents=intents)
+# synthesis runs on worker threads, one queue per guild
+worker = SynthesisWorker(max_workers=4)
 params_speech = {"speech_var_a": 0.3, "speech_var_b": 0.5, "speech_speed": 1.3}
 
-def get_speakers():
-    games = {0: "gothic", 1: "risen", 2: "skyrim", 3: "witcher"}
-    speakers = []
-    for i in range(0, 4):
-        with open(f'static_web/resource/json-mapping/{i}_sorted.json', 'r') as f:
-            data = json.load(f)
-        for k, v in data.items():
-            speakers.append({"name": f'{k} ({games[i].capitalize()}, {v})', "value": int(v)})
-    return speakers
+speaker_index = SpeakerIndex(Path(APP_FOLDER, "static_web/resource/json-mapping"))
 
 async def speaker_autocomplete(
     interaction: discord.Interaction,
     current: str,
 ) -> List[app_commands.Choice[str]]:
-    speakers = get_speakers()
     return [
         app_commands.Choice(name=s['name'], value=s['value'])
-        for s in speakers if current.lower() in s['name'].lower()
-    ][:25]
+        for s in speaker_index.search(current, limit=25)
+    ]
 
 @client.event
 async def on_ready():
@@ -84,10 +84,13 @@ async def on_ready():
 async def on_voice_state_update(member, before, after):
     if member.id != client.user.id and before.channel is None and after.channel is not None:
         speaker = random.randint(0,132)
-        audiopath = synthesize(f"Hallo {member.display_name}, willkommen im {after.channel.name} Kanal!", speaker, "namenloser_held", params_speech)
+        # seeded, so repeated greetings come straight from the audio cache
+        try:
+            _, audio_source = await worker.run(after.channel.guild.id, synthesize, f"Hallo {member.display_name}, willkommen im {after.channel.name} Kanal!", speaker, params_speech, seed=0)
+        except asyncio.QueueFull:
+            return
         channel = after.channel
-        await play_in_channel(audiopath, channel, after.channel.guild)
-        os.remove(str(audiopath))
+        await play_in_channel(audio_source, channel, after.channel.guild)
 
 @client.tree.command(name="tts", description="Generate Text-To-Speech Output")
 @app_commands.describe(speaker="Voice")
@@ -101,39 +104,36 @@ async def tts(interaction: discord.Interaction, text: str, speaker: int=47, spee
     await interaction.response.send_message("Verarbeite...")
     channel = client.get_channel(interaction.channel_id)
     try:
-        audiopath = synthesize(text, speaker, "namenloser_held", params_speech)
-    except ValueError:
-        speaker = 47
-        audiopath = synthesize(text, speaker, "namenloser_held", params_speech)
+        try:
+            audio_data, audio_source = await worker.run(interaction.guild_id, synthesize, text, speaker, params_speech)
+        except ValueError:
+            speaker = 47
+            audio_data, audio_source = await worker.run(interaction.guild_id, synthesize, text, speaker, params_speech)
+    except asyncio.QueueFull:
+        return await interaction.edit_original_response(content="Zu viele Anfragen, bitte warte einen Moment!")
     await interaction.edit_original_response(content="Fertig!")
-    await channel.send(file=discord.File(str(audiopath)))
+    file_name = f"{speaker}_namenloser_held_{datetime.now().strftime('%m%d%f')}.wav"
+    await channel.send(file=discord.File(wav_bytes(audio_data), filename=file_name))
     voice = interaction.user.voice.channel
-    await play_in_channel(audiopath, voice, interaction.guild)
-    os.remove(str(audiopath))
+    await play_in_channel(audio_source, voice, interaction.guild)
 
-async def play_in_channel(audiopath, channel, guild):
+async def play_in_channel(audio_source, channel, guild):
     try:
-        with wave.open(str(audiopath)) as mywav:
-            duration_seconds = mywav.getnframes() / mywav.getframerate()
         await channel.connect()
         voice_client: discord.VoiceClient = discord.utils.get(client.voice_clients, guild=guild)
-        audio_source = discord.FFmpegPCMAudio(str(audiopath))
-        voice_client.play(audio_source, after=None)
-        await asyncio.sleep(duration_seconds + 1)
+        # the player thread reports the end of playback through after
+        loop = asyncio.get_running_loop()
+        finished = asyncio.Event()
+        voice_client.play(audio_source, after=lambda err: loop.call_soon_threadsafe(finished.set))
+        await finished.wait()
         await voice_client.disconnect()
     except (discord.ext.commands.errors.CommandInvokeError, AttributeError):
         pass
 
-def synthesize(text, speaker_id, speaker_name, params):
-    audio_data = synthesizer.synthesize(text, speaker_id, params)
-    cur_timestamp = datetime.now().strftime("%m%d%f")
-    tmp_path = Path("static_web", "tmp")
-
-    if not tmp_path.exists():
-        tmp_path.mkdir()
-
-    file_name = "_".join(
-        [str(speaker_id), speaker_name, str(cur_timestamp), "tmp_file"])
-    return save_audio(tmp_path, file_name, audio_data)
+def synthesize(text, speaker_id, params, seed=None):
+    # blocking, only call through worker.run. The voice source is built here
+    # too, its resampling would block the event loop
+    audio_data = engine.synthesize(text, speaker_id, params, seed)
+    return audio_data, NumpyPCMAudio(audio_data)
 
 client.run(TOKEN)
@@ -8,6 +8,7 @@ from tkinter import filedialog
 import traceback
 import platform
 from app.utils import *
+from app.batch_job import BatchJob, parse_lines
 
 try:
     from vits.synthesizer import Synthesizer
@@ -21,6 +22,12 @@ try:
         synthesizer.load_model(TTS_MODEL_PATH)
 
     synthesizer.init_speaker_map(SPEAKER_CONFIG)
+    synthesizer.init_phoneme_cache(PHONEME_CACHE_PATH)
+    synthesizer.init_audio_cache(AUDIO_CACHE_PATH)
+    synthesizer.warm_speaker_cache()
+    if PLATFORM == "Linux":
+        # forking a process with a macOS GUI toolkit loaded is unsafe
+        synthesizer.init_text_frontend()
 
 except ImportError as err:
     print(err)
@@ -28,7 +35,16 @@ except ImportError as err:
 
 
 def synthesize(text, speaker_id, speaker_name, params):
-    audio_data = synthesizer.synthesize(text, speaker_id, params)
+    audio_data = synthesizer.synthesize(
+        text, speaker_id, params, seed=params.get("seed")
+    )
+    tmp_file = save_outputs(text, speaker_id, speaker_name, audio_data, params)
+    eel.addTableRow(speaker_name, text, tmp_file)
+
+
+def save_outputs(text, speaker_id, speaker_name, audio_data, params):
+    """Writes the wav the GUI plays and, if an output folder is set, the
+    exported file. Returns the path of the former relative to static_web."""
     cur_timestamp = datetime.now().strftime("%m%d%f")
     tmp_path = Path("static_web", "tmp")
 
@@ -47,7 +63,7 @@ def synthesize(text, speaker_id, speaker_name, params):
             save_file_path, save_file_name, audio_data, params["file_export_ext"]
         )
 
-    eel.addTableRow(speaker_name, text, str(Path("tmp", ".".join([file_name, "wav"]))))
+    return str(Path("tmp", ".".join([file_name, "wav"])))
 
 
 @eel.expose
@@ -83,15 +99,24 @@ def process_input(params=None):
             )
 
         if params["file_content"]:
-            for line in params["file_content"]:
-                if len(line.split("|")) > 1:
-                    text, sp_id = line.split("|")
-                    sp_name = synthesizer.get_speaker_by_id(sp_id)
-                    synthesize(text, sp_id, sp_name, params)
-                else:
-                    synthesize(
-                        line, params["speaker_id"], params["speaker_name"], params
-                    )
+            batch_lines = parse_lines(
+                params["file_content"],
+                synthesizer,
+                params["speaker_id"],
+                params["speaker_name"],
+            )
+            job = BatchJob(
+                synthesizer,
+                params,
+                write_fn=lambda line, audio: save_outputs(
+                    line.text, line.speaker_id, line.speaker_name, audio, params
+                ),
+                on_done=lambda line, tmp_file: eel.addTableRow(
+                    line.speaker_name, line.text, tmp_file
+                ),
+                frontend=synthesizer.text_frontend,
+            )
+            job.run(batch_lines)
         eel.finishSynthesize()
 
     except Exception as err:
@@ -115,6 +140,8 @@ def select_out_dir():
 
 @eel.expose
 def exit_clean_up():
+    if synthesizer.text_frontend is not None:
+        synthesizer.text_frontend.shutdown()
     tmp_files = Path("static_web", "tmp").glob("*.*")
     for f in tmp_files:
         f.unlink()
@@ -0,0 +1,40 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# the app is run from the repository root, it is not an installed package
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+
+CONFIG_PATH = Path(Path(__file__).parent.parent, "vits", "model", "config.json")
+# a different checkpoint can be benchmarked through GAMETTS_CHECKPOINT
+CHECKPOINT_PATH = Path(
+    os.environ.get(
+        "GAMETTS_CHECKPOINT", Path(Path(__file__).parent.parent, "vits", "model", "G_600000.pth")
+    )
+)
+
+
+@pytest.fixture(scope="session")
+def synthesizer():
+    if not CHECKPOINT_PATH.exists():
+        pytest.skip(f"no model checkpoint at {CHECKPOINT_PATH}")
+    from vits.synthesizer import Synthesizer
+
+    synthesizer = Synthesizer(str(CONFIG_PATH))
+    synthesizer.load_model(str(CHECKPOINT_PATH))
+    synthesizer.warm_speaker_cache()
+    return synthesizer
+
+
+@pytest.fixture
+def tts_benchmark(synthesizer):
+    """Runs vits.benchmark.run_benchmark on the loaded synthesizer, by
+    default over the example corpus, and returns its results"""
+    from vits.benchmark import load_corpus, run_benchmark
+
+    def run(corpus=None, **kwargs):
+        return run_benchmark(synthesizer, corpus or load_corpus(), **kwargs)
+
+    return run
@@ -0,0 +1,51 @@
+import pytest
+import torch
+
+from vits.attentions import MultiHeadAttention
+
+WINDOW_SIZE = 4
+
+
+def make_attention():
+    torch.manual_seed(0)
+    return MultiHeadAttention(16, 16, 2, window_size=WINDOW_SIZE)
+
+
+@pytest.mark.parametrize("length", range(1, 41))
+def test_add_relative_band_matches_absolute_positions(length):
+    attn = make_attention()
+    query = torch.randn(2, 2, length, 8, requires_grad=True)
+
+    # reference: relative logits over all 2*l-1 positions, shifted to absolute ones
+    rel_embeddings = attn._get_relative_embeddings(attn.emb_rel_k, length)
+    expected = attn._relative_position_to_absolute_position(
+        attn._matmul_with_relative_keys(query, rel_embeddings)
+    )
+    scores = attn._add_relative_band(
+        torch.zeros(2, 2, length, length), attn._matmul_with_relative_keys(query, attn.emb_rel_k)
+    )
+    assert torch.allclose(scores, expected, atol=1e-6)
+
+    grad = torch.randn_like(scores)
+    (expected_grad,) = torch.autograd.grad(expected, query, grad)
+    (band_grad,) = torch.autograd.grad(scores, query, grad)
+    assert torch.allclose(band_grad, expected_grad, atol=1e-6)
+
+
+@pytest.mark.parametrize("length", range(1, 41))
+def test_relative_band_matches_relative_positions(length):
+    attn = make_attention()
+    p_attn = torch.softmax(torch.randn(2, 2, length, length), dim=-1).requires_grad_()
+
+    # reference: weights of all 2*l-1 relative positions times the padded embeddings
+    rel_embeddings = attn._get_relative_embeddings(attn.emb_rel_v, length)
+    expected = attn._matmul_with_relative_values(
+        attn._absolute_position_to_relative_position(p_attn), rel_embeddings
+    )
+    output = attn._matmul_with_relative_values(attn._relative_band(p_attn), attn.emb_rel_v)
+    assert torch.allclose(output, expected, atol=1e-6)
+
+    grad = torch.randn_like(output)
+    (expected_grad,) = torch.autograd.grad(expected, p_attn, grad)
+    (band_grad,) = torch.autograd.grad(output, p_attn, grad)
+    assert torch.allclose(band_grad, expected_grad, atol=1e-6)
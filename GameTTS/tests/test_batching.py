@@ -0,0 +1,40 @@
+import pytest
+import torch
+
+from vits import models, utils
+from vits.text.symbols import symbols
+
+from conftest import CONFIG_PATH
+
+
+@pytest.fixture(scope="module")
+def net():
+    hps = utils.get_hparams_from_file(str(CONFIG_PATH))
+    torch.manual_seed(0)
+    return models.SynthesizerTrn(
+        len(symbols),
+        hps.data.filter_length // 2 + 1,
+        hps.train.segment_size // hps.data.hop_length,
+        n_speakers=hps.data.n_speakers,
+        inference_only=True,
+        **hps.model
+    ).eval()
+
+
+def test_batched_inference_matches_single_items(net):
+    torch.manual_seed(1)
+    seqs = [torch.randint(1, 100, (n,)) for n in (40, 17, 5)]
+    x = torch.nn.utils.rnn.pad_sequence(seqs, batch_first=True)
+    x_lengths = torch.tensor([len(seq) for seq in seqs])
+    sid = torch.tensor([3, 7, 9])
+
+    # without noise the outputs are deterministic, padding is the only difference
+    with torch.no_grad():
+        audio, _, y_mask, _ = net.infer(x, x_lengths, sid, noise_scale=0, noise_scale_w=0)
+        for i, seq in enumerate(seqs):
+            single, _, _, _ = net.infer(
+                seq[None], x_lengths[i : i + 1], sid[i : i + 1], noise_scale=0, noise_scale_w=0
+            )
+            n_samples = single.size(2)
+            assert n_samples == int(y_mask[i].sum()) * net.dec.upsample_factor
+            assert torch.allclose(audio[i, :, :n_samples], single[0], atol=1e-6)
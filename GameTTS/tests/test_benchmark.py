@@ -0,0 +1,18 @@
+from vits.benchmark import STAGES, load_corpus
+
+
+def test_benchmark_cold_phonemes(tts_benchmark, record_property):
+    results = tts_benchmark(load_corpus()[:4], n_runs=1, warmup=1)
+    assert results["utterances"] == 4
+    assert results["rtf"] > 0
+    assert set(results["stages"]) == set(STAGES)
+    assert results["stages"]["vocoder"]["total"] > 0
+    record_property("rtf", results["rtf"])
+    record_property("latency_p50", results["latency"]["p50"])
+
+
+def test_benchmark_warm_phonemes(tts_benchmark, record_property):
+    results = tts_benchmark(load_corpus()[:4], n_runs=1, warmup=1, cold_phonemes=False)
+    assert results["stages"]["phonemization"]["total"] >= 0
+    record_property("rtf", results["rtf"])
+    record_property("latency_p50", results["latency"]["p50"])
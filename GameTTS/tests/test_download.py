@@ -0,0 +1,131 @@
+import hashlib
+import http.server
+import os
+import threading
+
+import pytest
+
+from app.utils import download_file
+
+DATA = os.urandom(3 * 1024 * 1024 + 123)
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+class StandIn:
+    """Local stand-in for the release server. cut_after drops the
+    connection after that many bytes, ignore_range answers every request
+    with the whole file."""
+
+    def __init__(self):
+        self.cut_after = None
+        self.ignore_range = False
+        self.requests = []
+
+
+@pytest.fixture
+def server():
+    stand_in = StandIn()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            range_header = self.headers.get("Range")
+            stand_in.requests.append(range_header)
+            start = 0
+            if range_header and not stand_in.ignore_range:
+                start = int(range_header.split("=")[1].split("-")[0])
+                if start >= len(DATA):
+                    self.send_response(416)
+                    self.end_headers()
+                    return
+                self.send_response(206)
+            else:
+                self.send_response(200)
+            body = DATA[start:]
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if stand_in.cut_after is not None:
+                self.wfile.write(body[: stand_in.cut_after])
+                self.wfile.flush()
+                self.connection.shutdown(2)
+                return
+            self.wfile.write(body)
+
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    stand_in.url = f"http://127.0.0.1:{httpd.server_port}/G_600000.pth"
+    yield stand_in
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def part_path(file_path):
+    return file_path.with_name(file_path.name + ".part")
+
+
+def test_download_complete(server, tmp_path):
+    file_path = tmp_path / "G.pth"
+    progress = []
+    download_file(server.url, file_path, SHA256, progress=lambda done, total: progress.append((done, total)))
+    assert file_path.read_bytes() == DATA
+    assert not part_path(file_path).exists()
+    assert progress[-1] == (len(DATA), len(DATA))
+
+
+def test_interrupted_download_resumes(server, tmp_path):
+    file_path = tmp_path / "G.pth"
+    server.cut_after = 1024 * 1024
+    with pytest.raises(Exception):
+        download_file(server.url, file_path, SHA256)
+    assert not file_path.exists()
+    assert part_path(file_path).stat().st_size == 1024 * 1024
+
+    server.cut_after = None
+    download_file(server.url, file_path, SHA256)
+    assert server.requests[-1] == f"bytes={1024 * 1024}-"
+    assert file_path.read_bytes() == DATA
+
+
+def test_ignored_range_starts_over(server, tmp_path):
+    file_path = tmp_path / "G.pth"
+    part_path(file_path).write_bytes(DATA[:1000])
+    server.ignore_range = True
+    download_file(server.url, file_path, SHA256)
+    assert server.requests == ["bytes=1000-"]
+    assert file_path.read_bytes() == DATA
+
+
+def test_complete_part_file_gets_416(server, tmp_path):
+    file_path = tmp_path / "G.pth"
+    part_path(file_path).write_bytes(DATA)
+    download_file(server.url, file_path, SHA256)
+    assert server.requests == [f"bytes={len(DATA)}-"]
+    assert file_path.read_bytes() == DATA
+
+
+def test_checksum_mismatch(server, tmp_path):
+    file_path = tmp_path / "G.pth"
+    with pytest.raises(ValueError):
+        download_file(server.url, file_path, "0" * 64)
+    assert not file_path.exists()
+    assert not part_path(file_path).exists()
+
+
+def test_corrupted_part_file_is_rejected(server, tmp_path):
+    file_path = tmp_path / "G.pth"
+    part_path(file_path).write_bytes(b"\0" * 1000)
+    with pytest.raises(ValueError):
+        download_file(server.url, file_path, SHA256)
+    assert not file_path.exists()
+    assert not part_path(file_path).exists()
+
+
+def test_part_file_without_checksum_is_resumed(server, tmp_path):
+    file_path = tmp_path / "G.pth"
+    part_path(file_path).write_bytes(DATA[:1000])
+    download_file(server.url, file_path)
+    assert server.requests == ["bytes=1000-"]
+    assert file_path.read_bytes() == DATA
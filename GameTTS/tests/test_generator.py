@@ -0,0 +1,38 @@
+import pytest
+import torch
+
+from vits import models, utils
+
+from conftest import CONFIG_PATH
+
+
+@pytest.fixture(scope="module")
+def dec():
+    hps = utils.get_hparams_from_file(str(CONFIG_PATH))
+    torch.manual_seed(0)
+    return models.Generator(
+        hps.model.inter_channels,
+        hps.model.resblock,
+        hps.model.resblock_kernel_sizes,
+        hps.model.resblock_dilation_sizes,
+        hps.model.upsample_rates,
+        hps.model.upsample_initial_channel,
+        hps.model.upsample_kernel_sizes,
+        gin_channels=hps.model.gin_channels,
+    ).eval()
+
+
+@pytest.mark.parametrize("chunk_size", [7, "context", 32, 100])
+def test_chunked_decode_matches_full_decode(dec, chunk_size):
+    if chunk_size == "context":
+        chunk_size = dec.context_frames
+    torch.manual_seed(1)
+    x = torch.randn(1, dec.conv_pre.in_channels, 50)
+    g = torch.randn(1, dec.cond.in_channels, 1)
+
+    with torch.no_grad():
+        full = dec(x, g=g)
+        chunks = list(dec.forward_chunked(x, g=g, chunk_size=chunk_size))
+
+    assert len(chunks) == -(-x.size(2) // chunk_size)
+    assert torch.allclose(torch.cat(chunks, -1), full, atol=1e-6)
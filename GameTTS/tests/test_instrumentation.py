@@ -0,0 +1,31 @@
+import pytest
+import torch
+
+from vits import instrumentation
+from vits.instrumentation import Instrumentation
+
+
+def test_disabled_stage_records_nothing():
+    inst = Instrumentation()
+    with inst.stage("dec", frames=10) as record:
+        record.set(samples=100)
+    assert inst.stats() == {}
+
+
+@pytest.mark.skipif(
+    torch.cuda.is_initialized() or instrumentation.resource is None,
+    reason="measures the peak RSS of the process",
+)
+def test_stage_records_cpu_memory():
+    inst = Instrumentation(enabled=True)
+    events = []
+    inst.add_callback(events.append)
+    with inst.stage("dec", frames=10) as record:
+        record.set(samples=100)
+
+    stats = inst.stats()["dec"]
+    assert stats["calls"] == 1
+    assert stats["items"] == {"frames": 10, "samples": 100}
+    assert stats["memory_bytes"] > 0
+    assert events[0]["memory_bytes"] == stats["memory_bytes"]
+    assert 'gametts_stage_memory_bytes{stage="dec"}' in inst.prometheus_text()
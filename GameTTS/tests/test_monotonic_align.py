@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+import torch
+
+from vits import commons
+from vits.monotonic_align import maximum_path
+from vits.monotonic_align.core import (
+    maximum_path_numba,
+    maximum_path_numpy,
+    maximum_path_reference,
+)
+
+KERNELS = [maximum_path_numpy]
+if maximum_path_numba is not None:
+    KERNELS.append(maximum_path_numba)
+
+
+def random_batch(b, t_x, t_y, rng):
+    """Scores padded to the longest item, t_x <= t_y for every item"""
+    t_xs = rng.integers(max(t_x // 2, 1), t_x + 1, size=b)
+    t_xs[0] = t_x
+    t_ys = np.maximum(t_xs * t_y // t_x - rng.integers(0, max(t_y // 10, 1), size=b), t_xs)
+    t_ys[0] = t_y
+    values = rng.standard_normal((b, t_ys.max(), t_x)).astype(np.float32) * 10
+    return values, t_ys, t_xs
+
+
+@pytest.mark.parametrize("kernel", KERNELS, ids=lambda kernel: kernel.__name__)
+@pytest.mark.parametrize(
+    "b, t_x, t_y", [(1, 1, 1), (1, 6, 6), (3, 5, 5), (4, 7, 30), (8, 40, 160), (4, 120, 700)]
+)
+def test_kernel_matches_reference(kernel, b, t_x, t_y):
+    values, t_ys, t_xs = random_batch(b, t_x, t_y, np.random.default_rng(t_x * t_y))
+
+    expected = np.zeros(values.shape, dtype=np.int32)
+    maximum_path_reference(expected, values.copy(), t_ys, t_xs)
+    path = np.zeros(values.shape, dtype=np.int32)
+    kernel(path, values.copy(), t_ys, t_xs)
+    assert np.array_equal(path, expected)
+
+
+def test_equal_lengths_give_the_diagonal():
+    values, t_ys, t_xs = random_batch(3, 9, 9, np.random.default_rng(0))
+    t_ys[:] = t_xs[:] = 9
+    path = np.zeros(values.shape, dtype=np.int32)
+    maximum_path_numpy(path, values, t_ys, t_xs)
+    assert np.array_equal(path, np.broadcast_to(np.eye(9, dtype=np.int32), path.shape))
+
+
+def test_maximum_path_is_a_monotonic_alignment():
+    torch.manual_seed(0)
+    x_lengths = torch.tensor([30, 20, 11, 5])
+    y_lengths = torch.tensor([120, 90, 40, 5])
+    mask = (
+        commons.sequence_mask(y_lengths, 120).unsqueeze(-1)
+        * commons.sequence_mask(x_lengths, 30).unsqueeze(1)
+    ).float()
+    path = maximum_path(torch.randn(4, 120, 30) * 5, mask)
+
+    assert torch.equal(path * (1 - mask), torch.zeros_like(path))
+    for i, (t_x, t_y) in enumerate(zip(x_lengths.tolist(), y_lengths.tolist())):
+        tokens = path[i, :t_y, :t_x].argmax(-1)
+        # every frame one token, starting at the first and ending at the last
+        assert torch.equal(path[i, :t_y, :t_x].sum(-1), torch.ones(t_y))
+        assert tokens[0] == 0 and tokens[-1] == t_x - 1
+        assert torch.all((tokens[1:] - tokens[:-1] >= 0) & (tokens[1:] - tokens[:-1] <= 1))
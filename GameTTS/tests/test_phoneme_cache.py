@@ -0,0 +1,25 @@
+from vits.text.phoneme_cache import PhonemeCache
+
+
+def test_detached_disk_store_is_not_touched(tmp_path):
+    cache = PhonemeCache()
+    cache.open_disk_store(tmp_path / "phonemes.sqlite")
+    cache.get_or_compute("de", "hallo", str.upper)
+
+    with cache.detached_disk_store():
+        cache.clear(disk=False)
+        assert cache.get_or_compute("de", "hallo", str.lower) == "hallo"
+        cache.get_or_compute("de", "welt", str.upper)
+
+    cache.clear(disk=False)
+    assert cache.get_or_compute("de", "hallo", str.lower) == "HALLO"
+    assert cache.get_or_compute("de", "welt", str.lower) == "welt"
+    assert cache.disk_hits == 1
+
+
+def test_clear_empties_the_disk_store(tmp_path):
+    cache = PhonemeCache()
+    cache.open_disk_store(tmp_path / "phonemes.sqlite")
+    cache.get_or_compute("de", "hallo", str.upper)
+    cache.clear()
+    assert cache.get_or_compute("de", "hallo", str.lower) == "hallo"
@@ -0,0 +1,37 @@
+import pytest
+import torch
+
+from vits.transforms import (
+    linear_tails_rational_quadratic_spline,
+    unconstrained_rational_quadratic_spline,
+)
+
+
+@pytest.mark.parametrize("inverse", [False, True])
+@pytest.mark.parametrize("tail_bound", [1.0, 5.0])
+def test_linear_tails_spline_matches_masked_spline(inverse, tail_bound):
+    torch.manual_seed(0)
+    num_bins = 10
+    inputs = torch.randn(4, 1, 300) * tail_bound
+    # on the bounds and far outside them
+    inputs[0, 0, :4] = torch.tensor([-tail_bound, tail_bound, -4 * tail_bound, 4 * tail_bound])
+    args = (
+        inputs,
+        torch.randn(4, 1, 300, num_bins),
+        torch.randn(4, 1, 300, num_bins),
+        torch.randn(4, 1, 300, num_bins - 1),
+    )
+
+    ref_outputs, ref_logabsdet = unconstrained_rational_quadratic_spline(
+        *args, inverse=inverse, tails="linear", tail_bound=tail_bound
+    )
+    outputs, logabsdet = linear_tails_rational_quadratic_spline(
+        *args, inverse=inverse, tail_bound=tail_bound
+    )
+    assert torch.allclose(outputs, ref_outputs, atol=1e-5)
+    assert torch.allclose(logabsdet, ref_logabsdet, atol=1e-5)
+
+    outputs_only, _ = linear_tails_rational_quadratic_spline(
+        *args, inverse=inverse, tail_bound=tail_bound, compute_logabsdet=False
+    )
+    assert torch.equal(outputs_only, outputs)
@@ -154,10 +154,8 @@ class MultiHeadAttention(nn.Module):
     scores = torch.matmul(query / math.sqrt(self.k_channels), key.transpose(-2, -1))
     if self.window_size is not None:
       assert t_s == t_t, "Relative attention is only available for self-attention."
-      key_relative_embeddings = self._get_relative_embeddings(self.emb_rel_k, t_s)
-      rel_logits = self._matmul_with_relative_keys(query /math.sqrt(self.k_channels), key_relative_embeddings)
-      scores_local = self._relative_position_to_absolute_position(rel_logits)
-      scores = scores + scores_local
+      rel_logits = self._matmul_with_relative_keys(query / math.sqrt(self.k_channels), self.emb_rel_k)
+      scores = self._add_relative_band(scores, rel_logits)
     if self.proximal_bias:
       assert t_s == t_t, "Proximal bias is only available for self-attention."
       scores = scores + self._attention_bias_proximal(t_s).to(device=scores.device, dtype=scores.dtype)
@@ -171,9 +169,8 @@ class MultiHeadAttention(nn.Module):
     p_attn = self.drop(p_attn)
     output = torch.matmul(p_attn, value)
     if self.window_size is not None:
-      relative_weights = self._absolute_position_to_relative_position(p_attn)
-      value_relative_embeddings = self._get_relative_embeddings(self.emb_rel_v, t_s)
-      output = output + self._matmul_with_relative_values(relative_weights, value_relative_embeddings)
+      relative_weights = self._relative_band(p_attn)
+      output = output + self._matmul_with_relative_values(relative_weights, self.emb_rel_v)
     output = output.transpose(2, 3).contiguous().view(b, d, t_t) # [b, n_h, t_t, d_k] -> [b, d, t_t]
     return output, p_attn
 
@@ -195,6 +192,47 @@ class MultiHeadAttention(nn.Module):
     ret = torch.matmul(x, y.unsqueeze(0).transpose(-2, -1))
     return ret
 
+  def _band_rows(self, offset, length):
+    """Rows i of a [l, l] matrix whose diagonal offset holds (i, i + offset)"""
+    return max(-offset, 0), length - max(offset, 0)
+
+  def _add_relative_band(self, scores, rel_logits):
+    """
+    scores: [b, h, l, l]
+    rel_logits: [b, h, l, 2*window_size+1], logits of the keys at relative
+      positions -window_size..window_size
+    ret: scores, with rel_logits added in place along the diagonals of the
+      band. The same as adding _relative_position_to_absolute_position of
+      the full [b, h, l, 2*l-1] relative logits, without its O(l^2) buffers
+    """
+    length = scores.size(-1)
+    for r in range(2 * self.window_size + 1):
+      offset = r - self.window_size
+      if abs(offset) >= length:
+        continue
+      start, end = self._band_rows(offset, length)
+      scores.diagonal(offset, dim1=-2, dim2=-1).add_(rel_logits[..., start:end, r])
+    return scores
+
+  def _relative_band(self, p_attn):
+    """
+    p_attn: [b, h, l, l]
+    ret: [b, h, l, 2*window_size+1], the weights of the keys at relative
+      positions -window_size..window_size, the band of
+      _absolute_position_to_relative_position
+    """
+    length = p_attn.size(-1)
+    band = p_attn.new_zeros(*p_attn.shape[:-1], 2 * self.window_size + 1)
+    for r in range(2 * self.window_size + 1):
+      offset = r - self.window_size
+      if abs(offset) >= length:
+        continue
+      start, end = self._band_rows(offset, length)
+      band[..., start:end, r] = p_attn.diagonal(offset, dim1=-2, dim2=-1)
+    return band
+
+  # the full relative position forms below are the reference for the band
+  # helpers above, see tests/test_attentions.py
   def _get_relative_embeddings(self, relative_embeddings, length):
     max_relative_position = 2 * self.window_size + 1
     # Pad first before slice to avoid using cond ops.
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+
+class AudioCache:
+    """Content-addressed on-disk cache for synthesized audio.
+
+    Every entry is a float32 .npy file named after the sha256 of its key.
+    When the total size exceeds max_bytes the least recently used entries
+    are deleted, recency survives restarts through the file mtimes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        files = sorted(self.cache_dir.glob("*.npy"), key=lambda f: f.stat().st_mtime)
+        for f in files:
+            size = f.stat().st_size
+            self._entries[f.stem] = size
+            self._total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def make_key(text_seqs, speaker_id, speech_param, seed, model_id, batches):
+        """model_id identifies the model as it runs (checkpoint, quantization,
+        device), batches is the schedule of text_seqs: the noise of a seeded
+        request depends on how its sentences are batched"""
+        key = json.dumps(
+            [
+                [seq.tolist() for seq in text_seqs],
+                int(speaker_id),
+                float(speech_param["speech_var_a"]),
+                float(speech_param["speech_var_b"]),
+                float(speech_param["speech_speed"]),
+                int(seed),
+                model_id,
+                batches,
+            ]
+        )
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return Path(self.cache_dir, key + ".npy")
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            try:
+                audio = np.load(self._path(key))
+                os.utime(self._path(key))
+            except (OSError, ValueError):
+                self._total_bytes -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return audio
+
+    def put(self, key, audio):
+        with self._lock:
+            path = self._path(key)
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, audio.astype(np.float32))
+            os.replace(tmp_path, path)
+
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = path.stat().st_size
+            self._total_bytes += self._entries[key]
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+        }
@@ -0,0 +1,203 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import time
+
+import numpy as np
+import torch
+from scipy.io.wavfile import write
+
+from vits.instrumentation import instrumentation
+from vits.text.cleaners import phoneme_cache
+
+STAGES = ['segmentation', 'phonemization', 'text_encoder', 'duration_predictor', 'alignment', 'flow', 'vocoder', 'audio_encoding']
+# instrumentation stages reported under the benchmark stage names
+INSTRUMENTED_STAGES = {
+  'segmenter': 'segmentation',
+  'cleaner': 'phonemization',
+  'enc_p': 'text_encoder',
+  'dp': 'duration_predictor',
+  'generate_path': 'alignment',
+  'flow': 'flow',
+  'dec': 'vocoder',
+  'encode': 'audio_encoding',
+}
+
+DEFAULT_CORPUS = os.path.normpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'example_input_file.csv'))
+DEFAULT_PARAM = {"speech_var_a": 0.345, "speech_var_b": 0.5, "speech_speed": 1.1}
+
+
+def load_corpus(corpus_path=DEFAULT_CORPUS, paragraph_sizes=(2, 4, 8)):
+  """
+  Returns the sentences of a batch input file (one "text|speaker" or
+  "text" per line) followed by synthetic paragraphs made of the first
+  2, 4, 8, ... sentences, so the corpus covers increasing input lengths.
+  """
+  with open(corpus_path, encoding='utf-8') as f:
+    sentences = [line.split('|')[0].strip() for line in f if line.strip()]
+  # the example file repeats its lines with speaker ids
+  sentences = list(dict.fromkeys(sentences))
+
+  corpus = list(sentences)
+  for size in paragraph_sizes:
+    words = (sentences * (size // len(sentences) + 1))[:size]
+    corpus.append(' '.join(words))
+  return corpus
+
+
+def percentiles(values):
+  values = np.asarray(values, dtype=np.float64)
+  return {
+    'mean': float(values.mean()),
+    'p50': float(np.percentile(values, 50)),
+    'p95': float(np.percentile(values, 95)),
+    'p99': float(np.percentile(values, 99)),
+  }
+
+
+class StageTimes():
+  """Instrumentation callback summing the seconds of every stage"""
+  def __init__(self):
+    self.times = {}
+
+  def __call__(self, event):
+    stage = INSTRUMENTED_STAGES.get(event['stage'])
+    if stage is not None:
+      self.times[stage] = self.times.get(stage, 0.) + event['seconds']
+
+
+def synthesize_timed(synthesizer, text, speaker_id, speech_param, stage_times, seed=0):
+  """
+  Runs Synthesizer.synthesize and encodes the audio as wav, returns the
+  audio and the seconds spent in every stage as reported by the
+  instrumentation.
+  """
+  stage_times.times = {}
+  audio = synthesizer.synthesize(text, speaker_id, speech_param, seed=seed)
+
+  buffer = io.BytesIO()
+  audio_data = ((audio / 1.414) * 32767).astype(np.int16)
+  with instrumentation.stage('encode', samples=len(audio_data)):
+    write(buffer, synthesizer.hps_config.data.sampling_rate, audio_data)
+  return audio, stage_times.times
+
+
+def run_benchmark(synthesizer, corpus, speaker_id=0, speech_param=DEFAULT_PARAM, n_runs=3, warmup=1, cold_phonemes=True):
+  """
+  Synthesizes every corpus entry n_runs times after warmup runs and
+  returns per-stage and end-to-end latency percentiles, real-time factor
+  (compute seconds per second of audio) and throughput.
+  """
+  sampling_rate = synthesizer.hps_config.data.sampling_rate
+  stage_times = StageTimes()
+  instrumentation.add_callback(stage_times)
+  was_enabled = instrumentation.enabled
+  instrumentation.enable()
+  # every run must synthesize, not read the audio cache
+  audio_cache, synthesizer.audio_cache = synthesizer.audio_cache, None
+  stage_values = {stage: [] for stage in STAGES}
+  totals = []
+  audio_seconds = 0.
+
+  # cold runs must not touch the user's persistent phoneme store
+  store = phoneme_cache.detached_disk_store() if cold_phonemes else contextlib.nullcontext()
+  try:
+    with store:
+      for run in range(warmup + n_runs):
+        for text in corpus:
+          if cold_phonemes:
+            phoneme_cache.clear(disk=False)
+          start = time.perf_counter()
+          audio, times = synthesize_timed(synthesizer, text, speaker_id, speech_param, stage_times)
+          total = time.perf_counter() - start
+          if run < warmup:
+            continue
+          totals.append(total)
+          audio_seconds += len(audio) / sampling_rate
+          for stage in STAGES:
+            stage_values[stage].append(times.get(stage, 0.))
+  finally:
+    synthesizer.audio_cache = audio_cache
+    instrumentation.remove_callback(stage_times)
+    if not was_enabled:
+      instrumentation.disable()
+
+  compute_seconds = sum(totals)
+  results = {
+    'utterances': len(totals),
+    'audio_seconds': audio_seconds,
+    'compute_seconds': compute_seconds,
+    'rtf': compute_seconds / audio_seconds,
+    'throughput_audio_seconds_per_second': audio_seconds / compute_seconds,
+    'throughput_utterances_per_second': len(totals) / compute_seconds,
+    'latency': percentiles(totals),
+    'stages': {},
+  }
+  for stage, values in stage_values.items():
+    results['stages'][stage] = dict(
+        percentiles(values),
+        total=sum(values),
+        rtf=sum(values) / audio_seconds,
+        share=sum(values) / compute_seconds)
+  return results
+
+
+def environment():
+  return {
+    'torch': torch.__version__,
+    'python': platform.python_version(),
+    'machine': platform.machine(),
+    'threads': torch.get_num_threads(),
+    'cuda': torch.cuda.get_device_name() if torch.cuda.is_available() else None,
+  }
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Measure real-time factor and latency per pipeline stage')
+  parser.add_argument('-c', '--config', type=str, default='vits/model/config.json')
+  parser.add_argument('-m', '--model', type=str, default='vits/model/G_600000.pth')
+  parser.add_argument('-i', '--input', type=str, default=DEFAULT_CORPUS)
+  parser.add_argument('-o', '--output', type=str, default=None, help='write the results as json')
+  parser.add_argument('-s', '--speaker', type=int, default=0)
+  parser.add_argument('-n', '--runs', type=int, default=3)
+  parser.add_argument('--warmup', type=int, default=1)
+  parser.add_argument('--quantize', action='store_true')
+  parser.add_argument('--cpu', action='store_true')
+  parser.add_argument('--warm-phonemes', action='store_true', help='keep the phoneme cache between runs')
+  args = parser.parse_args()
+
+  from vits.synthesizer import Synthesizer
+
+  synthesizer = Synthesizer(args.config)
+  if args.cpu:
+    synthesizer.enable_disable_cuda(False)
+  synthesizer.load_model(args.model, quantize=args.quantize)
+  synthesizer.warm_speaker_cache()
+
+  corpus = load_corpus(args.input)
+  results = run_benchmark(synthesizer, corpus, args.speaker, n_runs=args.runs,
+      warmup=args.warmup, cold_phonemes=not args.warm_phonemes)
+  results['environment'] = environment()
+  results['config'] = {
+    'model': args.model,
+    'quantize': args.quantize,
+    'cuda': synthesizer.use_cuda,
+    'corpus': args.input,
+    'corpus_entries': len(corpus),
+    'runs': args.runs,
+    'cold_phonemes': not args.warm_phonemes,
+  }
+
+  print("rtf {:.3f}  p50 {:.3f}s  p95 {:.3f}s  p99 {:.3f}s  {:.2f} audio s/s".format(
+      results['rtf'], results['latency']['p50'], results['latency']['p95'],
+      results['latency']['p99'], results['throughput_audio_seconds_per_second']))
+  for stage, stats in results['stages'].items():
+    print("  {:<20} rtf {:.4f}  p50 {:.4f}s  p95 {:.4f}s  {:5.1%}".format(
+        stage, stats['rtf'], stats['p50'], stats['p95'], stats['share']))
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(results, f, indent=2)
@@ -142,6 +142,33 @@ def generate_path(duration, mask):
   return path
 
 
+def duration_to_indices(duration, t_y):
+  """
+  Index form of generate_path.
+  duration: [b, 1, t_x], whole numbers (zero at padded tokens)
+  ret: [b, t_y], the token every frame is aligned to, t_x for frames
+    behind the last token
+  """
+  cum_duration = torch.cumsum(duration.squeeze(1), -1)
+  frames = torch.arange(t_y, dtype=cum_duration.dtype, device=duration.device)
+  frames = frames.expand(cum_duration.size(0), t_y).contiguous()
+  return torch.searchsorted(cum_duration, frames, right=True)
+
+
+def expand_by_indices(x, indices):
+  """
+  Same as torch.matmul(path, x.transpose(1, 2)).transpose(1, 2) for the path
+  of duration_to_indices, without building the [b, t_y, t_x] path.
+  x: [b, d, t_x]
+  indices: [b, t_y]
+  ret: [b, d, t_y], zero for frames behind the last token
+  """
+  # gathered as [b, t_y, d] rows, so the result has the strides of the matmul
+  # and randn_like draws the same noise for it
+  x = F.pad(x, [0, 1]).transpose(1, 2)
+  return torch.gather(x, 1, indices.unsqueeze(-1).expand(-1, -1, x.size(2))).transpose(1, 2)
+
+
 def clip_grad_value_(parameters, clip_value, norm_type=2):
   if isinstance(parameters, torch.Tensor):
     parameters = [parameters]
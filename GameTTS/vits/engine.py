@@ -0,0 +1,214 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from vits.instrumentation import instrumentation
+from vits.scheduler import BucketScheduler
+
+
+SPEECH_PARAM_KEYS = ("speech_var_a", "speech_var_b", "speech_speed")
+
+
+def _check_speech_param(speech_param):
+    """Raises ValueError for speech_param dicts infer_batch cannot use"""
+    if speech_param is None:
+        raise ValueError("speech_param is required")
+    try:
+        for key in SPEECH_PARAM_KEYS:
+            float(speech_param[key])
+    except (KeyError, TypeError, ValueError) as err:
+        raise ValueError(f"Invalid speech_param {speech_param!r}: {err!r}") from err
+
+
+class _Request:
+    """Collects the sentence waveforms of one synthesize call"""
+
+    def __init__(self, future, n_sentences):
+        self.future = future
+        self.audios = [None] * n_sentences
+        self.remaining = n_sentences
+        self.lock = threading.Lock()
+
+    def set_sentence(self, idx, audio):
+        with self.lock:
+            self.audios[idx] = audio
+            self.remaining -= 1
+            return self.remaining == 0
+
+
+class _Sentence:
+    def __init__(self, request, idx, text_seq, speaker_id, speech_param):
+        self.request = request
+        self.idx = idx
+        self.text_seq = text_seq
+        self.speaker_id = int(speaker_id)
+        self.speech_param = speech_param
+
+    @property
+    def group_key(self):
+        # noise and length scales are scalars in SynthesizerTrn.infer, the
+        # speaker id is per row so different speakers can share a batch
+        return tuple(float(self.speech_param[key]) for key in SPEECH_PARAM_KEYS)
+
+
+class _SeededRequest:
+    """Seeded requests are synthesized on their own so that their noise does
+    not depend on which other sentences happen to share the batch"""
+
+    def __init__(self, future, text, speaker_id, speech_param, seed):
+        self.future = future
+        self.text = text
+        self.speaker_id = speaker_id
+        self.speech_param = speech_param
+        self.seed = seed
+
+    def run(self, synthesizer):
+        try:
+            audio = synthesizer.synthesize(
+                self.text, self.speaker_id, self.speech_param, seed=self.seed
+            )
+        except Exception as err:
+            self.future.set_exception(err)
+        else:
+            self.future.set_result(audio)
+
+
+class InferenceEngine:
+    """Long-lived inference loop that batches sentences across callers.
+
+    Sentences submitted within max_wait seconds of each other are grouped by
+    their noise/length parameters, sorted into length buckets by the
+    scheduler and run through Synthesizer.infer_batch together. The model is
+    only ever touched from the engine thread.
+    """
+
+    def __init__(self, synthesizer, max_batch_size=8, max_wait=0.02, boundaries=None):
+        self.synthesizer = synthesizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.scheduler = BucketScheduler(boundaries, max_batch_size)
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(
+                target=self._run, name="InferenceEngine", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._running = False
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, text, speaker_id=0, speech_param=None, seed=None):
+        """Queues text for synthesis and returns a Future resolving to the
+        same float32 array Synthesizer.synthesize would return."""
+        n_speakers = self.synthesizer.hps_config.data.n_speakers
+        if not 0 <= int(speaker_id) < n_speakers:
+            raise ValueError(f"Speaker id {speaker_id} out of range")
+        _check_speech_param(speech_param)
+
+        future = Future()
+        if seed is not None:
+            self._queue.put(_SeededRequest(future, text, speaker_id, speech_param, seed))
+            return future
+
+        with instrumentation.stage("segmenter", characters=len(text)):
+            seg_text = self.synthesizer.segmenter.segment(text)
+        if not seg_text:
+            future.set_result(self.synthesizer.join_sentences([]))
+            return future
+
+        request = _Request(future, len(seg_text))
+        for idx, sentence in enumerate(seg_text):
+            text_seq = self.synthesizer.get_text(sentence)
+            self._queue.put(_Sentence(request, idx, text_seq, speaker_id, speech_param))
+        return future
+
+    def synthesize(self, text, speaker_id=0, speech_param=None, seed=None):
+        return self.submit(text, speaker_id, speech_param, seed).result()
+
+    def stats(self):
+        return self.scheduler.stats()
+
+    def _collect(self):
+        """Blocks for the first sentence, then keeps collecting until the
+        batching window closes or a full batch is waiting."""
+        item = self._queue.get()
+        if item is None:
+            return []
+        pending = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(pending) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            pending.append(item)
+        return pending
+
+    def _make_batches(self, pending):
+        groups = {}
+        for sentence in pending:
+            groups.setdefault(sentence.group_key, []).append(sentence)
+
+        batches = []
+        for group in groups.values():
+            lengths = [s.text_seq.size(0) for s in group]
+            for batch in self.scheduler.schedule(lengths):
+                batches.append([group[idx] for idx in batch])
+        return batches
+
+    def _run_batch(self, batch):
+        try:
+            audios = self.synthesizer.infer_batch(
+                [s.text_seq for s in batch],
+                [s.speaker_id for s in batch],
+                batch[0].speech_param,
+            )
+        except Exception as err:
+            for sentence in batch:
+                if not sentence.request.future.done():
+                    sentence.request.future.set_exception(err)
+            return
+
+        self.scheduler.record([s.text_seq.size(0) for s in batch])
+        for sentence, audio in zip(batch, audios):
+            request = sentence.request
+            if request.set_sentence(sentence.idx, audio) and not request.future.done():
+                request.future.set_result(
+                    self.synthesizer.join_sentences(request.audios)
+                )
+
+    def _run(self):
+        while self._running:
+            pending = []
+            try:
+                pending = self._collect()
+                for job in pending:
+                    if isinstance(job, _SeededRequest):
+                        job.run(self.synthesizer)
+                sentences = [job for job in pending if isinstance(job, _Sentence)]
+                for batch in self._make_batches(sentences):
+                    self._run_batch(batch)
+            except Exception as err:
+                # a failing iteration must not end the loop, later submits
+                # would never resolve
+                for job in pending:
+                    future = job.future if isinstance(job, _SeededRequest) else job.request.future
+                    if not future.done():
+                        future.set_exception(err)
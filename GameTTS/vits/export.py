@@ -0,0 +1,123 @@
+import argparse
+import copy
+import hashlib
+import os
+import time
+
+import torch
+
+from vits import utils
+from vits.mmap_checkpoint import load_mmap_state_dict, save_mmap_checkpoint
+
+# the artifact pickles the module objects, so it goes stale when their code changes
+MODEL_SOURCES = ['models.py', 'modules.py', 'attentions.py', 'commons.py', 'transforms.py']
+
+
+def inference_artifact_path(checkpoint_path):
+  root, ext = os.path.splitext(str(checkpoint_path))
+  return root + '.infer' + ext
+
+
+def inference_weights_path(checkpoint_path):
+  root, _ = os.path.splitext(str(checkpoint_path))
+  return root + '.infer.mmap'
+
+
+def _code_signature():
+  sha = hashlib.sha256()
+  source_dir = os.path.dirname(os.path.realpath(__file__))
+  for name in MODEL_SOURCES:
+    with open(os.path.join(source_dir, name), 'rb') as f:
+      sha.update(f.read())
+  return sha.hexdigest()
+
+
+def artifact_signature(checkpoint_path):
+  return utils.checkpoint_signature(checkpoint_path) + [torch.__version__, _code_signature()]
+
+
+def export_inference_model(model, checkpoint_path, build_seconds=None, checkpoint_sha256=None):
+  """
+  Saves a ready-to-run inference model next to checkpoint_path.
+
+  The module structure is pickled with its weights on the meta device, the
+  folded weights go to a memory-mapped weight file. Loading neither
+  constructs the modules in Python nor runs their random weight
+  initialisation, and the weights are views into the page cache that all
+  processes using the artifact share. The artifact also stores the sha256
+  of the checkpoint (computed unless given), so later starts know it
+  without reading the checkpoint.
+  """
+  artifact_path = inference_artifact_path(checkpoint_path)
+  utils.logger.info("Saving inference artifact to {}".format(artifact_path))
+  # the weights are written first, a complete artifact implies complete weights
+  save_mmap_checkpoint(model.state_dict(), inference_weights_path(checkpoint_path))
+  skeleton = copy.deepcopy(model).to('meta')
+  torch.save({
+      'model': skeleton,
+      'source': artifact_signature(checkpoint_path),
+      'build_seconds': build_seconds,
+      'sha256': checkpoint_sha256 or utils.checkpoint_sha256(checkpoint_path),
+  }, artifact_path)
+  return artifact_path
+
+
+def load_inference_model(checkpoint_path):
+  """
+  Returns the exported inference model for checkpoint_path, or None when
+  there is none or it was made from another checkpoint or model code. The
+  stored checkpoint hash is set as model.checkpoint_sha256 (None for
+  artifacts written before it was stored).
+  """
+  artifact_path = inference_artifact_path(checkpoint_path)
+  weights_path = inference_weights_path(checkpoint_path)
+  if not os.path.isfile(artifact_path) or not os.path.isfile(weights_path):
+    return None
+
+  start = time.perf_counter()
+  # the artifact is written locally by export_inference_model
+  try:
+    artifact = torch.load(artifact_path, map_location='cpu', weights_only=False)
+  except Exception as err:
+    # e.g. cut short by an interrupted export
+    utils.logger.warning("Inference artifact '{}' is unreadable: {}".format(artifact_path, err))
+    return None
+  if artifact.get('source') != artifact_signature(checkpoint_path):
+    utils.logger.info("Inference artifact '{}' is outdated".format(artifact_path))
+    return None
+  model = artifact['model']
+  model.load_state_dict(load_mmap_state_dict(weights_path), assign=True)
+  model.checkpoint_sha256 = artifact.get('sha256')
+
+  load_seconds = time.perf_counter() - start
+  if artifact.get('build_seconds') is not None:
+    utils.logger.info("Loaded inference artifact '{}' in {:.2f}s, {:.2f}s faster than building the model".format(
+        artifact_path, load_seconds, artifact['build_seconds'] - load_seconds))
+  else:
+    utils.logger.info("Loaded inference artifact '{}' in {:.2f}s".format(artifact_path, load_seconds))
+  return model
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Export the inference artifact for a checkpoint')
+  parser.add_argument('-c', '--config', type=str, default='vits/model/config.json')
+  parser.add_argument('-m', '--model', type=str, default='vits/model/G_600000.pth')
+  args = parser.parse_args()
+
+  from vits.synthesizer import Synthesizer
+
+  artifact_path = inference_artifact_path(args.model)
+  if os.path.isfile(artifact_path):
+    os.remove(artifact_path)
+
+  synthesizer = Synthesizer(args.config)
+  synthesizer.enable_disable_cuda(False)
+  start = time.perf_counter()
+  synthesizer.load_model(args.model)
+  build_seconds = time.perf_counter() - start
+
+  start = time.perf_counter()
+  synthesizer.load_model(args.model)
+  load_seconds = time.perf_counter() - start
+  print("build from checkpoint: {:.2f}s  load artifact: {:.2f}s  saved: {:.2f}s".format(
+      build_seconds, load_seconds, build_seconds - load_seconds))
@@ -0,0 +1,173 @@
+import contextlib
+import json
+import logging
+import sys
+import threading
+import time
+
+import torch
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+
+class _NullRecord:
+    def set(self, **info):
+        pass
+
+
+_NULL_RECORD = _NullRecord()
+_NULL_STAGE = contextlib.nullcontext(_NULL_RECORD)
+
+
+def _peak_rss():
+    """Peak resident set size of the process in bytes, None if unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _Record:
+    __slots__ = ("info",)
+
+    def __init__(self, info):
+        self.info = info
+
+    def set(self, **info):
+        """Adds sizes known only inside the stage, e.g. output lengths"""
+        self.info.update(info)
+
+
+class Instrumentation:
+    """Times and counts the stages of the synthesis pipeline.
+
+    Code marks a stage with
+
+        with instrumentation.stage("dec", batch=b, frames=t) as record:
+            ...
+            record.set(samples=n)
+
+    Numeric info values are summed per stage. memory_bytes is the CUDA
+    memory allocated after the stage when CUDA is in use, else the peak
+    resident set size of the process (None where that is unknown, e.g. on
+    Windows). While disabled, stage returns one shared no-op context
+    manager, so an instrumented call costs a function call and an attribute
+    check. Every finished stage is passed to the registered callbacks as a
+    dict, totals are available from stats and prometheus_text.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def enable(self):
+        self.enabled = True
+        return self
+
+    def disable(self):
+        self.enabled = False
+
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+        return callback
+
+    def remove_callback(self, callback):
+        self._callbacks.remove(callback)
+
+    def stage(self, name, **info):
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._timed(name, info)
+
+    @contextlib.contextmanager
+    def _timed(self, name, info):
+        record = _Record(info)
+        cuda = torch.cuda.is_initialized()
+        if cuda:
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            if cuda:
+                torch.cuda.synchronize()
+            seconds = time.perf_counter() - start
+            memory = torch.cuda.memory_allocated() if cuda else _peak_rss()
+            self._record(name, seconds, memory, record.info)
+
+    def _record(self, name, seconds, memory, info):
+        with self._lock:
+            stats = self._stages.setdefault(
+                name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "memory_bytes": None, "items": {}}
+            )
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            if memory is not None:
+                stats["memory_bytes"] = memory
+            for key, value in info.items():
+                if isinstance(value, (int, float)):
+                    stats["items"][key] = stats["items"].get(key, 0) + value
+
+        event = {"stage": name, "seconds": seconds, "memory_bytes": memory}
+        event.update(info)
+        for callback in self._callbacks:
+            callback(event)
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: dict(stats, items=dict(stats["items"]))
+                for name, stats in self._stages.items()
+            }
+
+    def prometheus_text(self, prefix="gametts"):
+        """Renders the totals in the Prometheus text exposition format"""
+        stats = self.stats()
+        metrics = [
+            ("stage_calls_total", "counter", "Number of times the stage ran",
+             lambda s: [("", s["calls"])]),
+            ("stage_seconds_total", "counter", "Seconds spent in the stage",
+             lambda s: [("", s["seconds"])]),
+            ("stage_seconds_max", "gauge", "Longest single run of the stage",
+             lambda s: [("", s["max_seconds"])]),
+            ("stage_memory_bytes", "gauge", "CUDA memory allocated, or peak process RSS without CUDA, after the last run",
+             lambda s: [("", s["memory_bytes"])] if s["memory_bytes"] is not None else []),
+            ("stage_items_total", "counter", "Summed sizes reported by the stage",
+             lambda s: [(f',item="{key}"', value) for key, value in sorted(s["items"].items())]),
+        ]
+
+        lines = []
+        for metric, kind, help_text, samples in metrics:
+            name = f"{prefix}_{metric}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for stage, stage_stats in sorted(stats.items()):
+                for labels, value in samples(stage_stats):
+                    lines.append(f'{name}{{stage="{stage}"{labels}}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def log_callback(logger=None, level=logging.DEBUG):
+    """Returns a callback that logs every stage event as one json line"""
+    logger = logger or logging.getLogger(__name__)
+
+    def callback(event):
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps(event))
+
+    return callback
+
+
+# shared by the synthesizer, the model and the apps, disabled by default
+instrumentation = Instrumentation()
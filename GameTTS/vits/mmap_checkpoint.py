@@ -0,0 +1,105 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+
+import torch
+
+MAGIC = b'GTTSMMAP'
+ALIGNMENT = 64
+# 8 bytes magic followed by the little endian uint64 length of the json header
+PREAMBLE = struct.Struct('<8sQ')
+
+_DTYPES = {
+  'float32': torch.float32,
+  'float16': torch.float16,
+  'bfloat16': torch.bfloat16,
+  'float64': torch.float64,
+  'int64': torch.int64,
+  'int32': torch.int32,
+  'int8': torch.int8,
+  'uint8': torch.uint8,
+  'bool': torch.bool,
+}
+
+
+def _align(offset):
+  return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_mmap_checkpoint(state_dict, checkpoint_path):
+  """
+  Writes a state dict as a flat weight file: preamble, json header and one
+  ALIGNMENT aligned raw blob per tensor. The file is written next to its
+  destination and renamed, so readers never see a partial file.
+  """
+  tensors = {k: v.detach().cpu().contiguous() for k, v in state_dict.items()}
+  header = {}
+  offset = 0
+  for name, tensor in tensors.items():
+    nbytes = tensor.numel() * tensor.element_size()
+    header[name] = {
+      'dtype': str(tensor.dtype).replace('torch.', ''),
+      'shape': list(tensor.shape),
+      'offset': offset,
+      'nbytes': nbytes,
+    }
+    offset = _align(offset + nbytes)
+
+  header_bytes = json.dumps(header).encode('utf-8')
+  data_start = _align(PREAMBLE.size + len(header_bytes))
+
+  tmp_path = str(checkpoint_path) + '.tmp'
+  with open(tmp_path, 'wb') as f:
+    f.write(PREAMBLE.pack(MAGIC, len(header_bytes)))
+    f.write(header_bytes)
+    for name, tensor in tensors.items():
+      f.seek(data_start + header[name]['offset'])
+      f.write(tensor.view(torch.uint8).numpy().tobytes() if tensor.numel() else b'')
+    f.truncate(data_start + offset)
+  os.replace(tmp_path, checkpoint_path)
+
+
+def load_mmap_state_dict(checkpoint_path):
+  """
+  Maps a file written by save_mmap_checkpoint and returns a state dict whose
+  tensors are views into the mapping. Nothing is read up front, pages are
+  faulted in from the page cache on first use and shared between all
+  processes mapping the same file. The mapping is copy-on-write, an
+  in-place update only copies the touched pages into the writing process.
+  """
+  with open(checkpoint_path, 'rb') as f:
+    magic, header_len = PREAMBLE.unpack(f.read(PREAMBLE.size))
+    if magic != MAGIC:
+      raise ValueError('{} is not a memory-mapped checkpoint'.format(checkpoint_path))
+    header = json.loads(f.read(header_len).decode('utf-8'))
+    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+  data_start = _align(PREAMBLE.size + header_len)
+  state_dict = {}
+  for name, info in header.items():
+    dtype = _DTYPES[info['dtype']]
+    if info['nbytes'] == 0:
+      state_dict[name] = torch.empty(info['shape'], dtype=dtype)
+      continue
+    # every tensor keeps a reference to the mapping, it stays open while in use
+    tensor = torch.frombuffer(buffer, dtype=torch.uint8, count=info['nbytes'],
+        offset=data_start + info['offset'])
+    state_dict[name] = tensor.view(dtype).view(info['shape'])
+  return state_dict
+
+
+def is_mmap_checkpoint(checkpoint_path):
+  with open(checkpoint_path, 'rb') as f:
+    return f.read(len(MAGIC)) == MAGIC
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Convert a training checkpoint to the memory-mapped format')
+  parser.add_argument('checkpoint', type=str)
+  parser.add_argument('output', type=str)
+  args = parser.parse_args()
+
+  checkpoint_dict = torch.load(args.checkpoint, map_location='cpu')
+  save_mmap_checkpoint(checkpoint_dict['model'], args.output)
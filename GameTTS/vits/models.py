@@ -8,10 +8,11 @@ from vits import attentions, modules, commons
 from torch.nn import Conv1d, ConvTranspose1d, AvgPool1d, Conv2d
 from torch.nn.utils import weight_norm, remove_weight_norm, spectral_norm
 from vits.commons import init_weights, get_padding
+from vits.instrumentation import instrumentation
 
 
 class StochasticDurationPredictor(nn.Module):
-  def __init__(self, in_channels, filter_channels, kernel_size, p_dropout, n_flows=4, gin_channels=0):
+  def __init__(self, in_channels, filter_channels, kernel_size, p_dropout, n_flows=4, gin_channels=0, inference_only=False):
     super().__init__()
     filter_channels = in_channels # it needs to be removed from future version.
     self.in_channels = in_channels
@@ -28,14 +29,16 @@ class StochasticDurationPredictor(nn.Module):
       self.flows.append(modules.ConvFlow(2, filter_channels, kernel_size, n_layers=3))
       self.flows.append(modules.Flip())
 
-    self.post_pre = nn.Conv1d(1, filter_channels, 1)
-    self.post_proj = nn.Conv1d(filter_channels, filter_channels, 1)
-    self.post_convs = modules.DDSConv(filter_channels, kernel_size, n_layers=3, p_dropout=p_dropout)
-    self.post_flows = nn.ModuleList()
-    self.post_flows.append(modules.ElementwiseAffine(2))
-    for i in range(4):
-      self.post_flows.append(modules.ConvFlow(2, filter_channels, kernel_size, n_layers=3))
-      self.post_flows.append(modules.Flip())
+    # the posterior flows are only needed to compute the training loss
+    if not inference_only:
+      self.post_pre = nn.Conv1d(1, filter_channels, 1)
+      self.post_proj = nn.Conv1d(filter_channels, filter_channels, 1)
+      self.post_convs = modules.DDSConv(filter_channels, kernel_size, n_layers=3, p_dropout=p_dropout)
+      self.post_flows = nn.ModuleList()
+      self.post_flows.append(modules.ElementwiseAffine(2))
+      for i in range(4):
+        self.post_flows.append(modules.ConvFlow(2, filter_channels, kernel_size, n_layers=3))
+        self.post_flows.append(modules.Flip())
 
     self.pre = nn.Conv1d(in_channels, filter_channels, 1)
     self.proj = nn.Conv1d(filter_channels, filter_channels, 1)
@@ -43,10 +46,12 @@ class StochasticDurationPredictor(nn.Module):
     if gin_channels != 0:
       self.cond = nn.Conv1d(gin_channels, filter_channels, 1)
 
-  def forward(self, x, x_mask, w=None, g=None, reverse=False, noise_scale=1.0):
+  def forward(self, x, x_mask, w=None, g=None, reverse=False, noise_scale=1.0, g_cond=None):
     x = torch.detach(x)
     x = self.pre(x)
-    if g is not None:
+    if g_cond is not None:
+      x = x + g_cond
+    elif g is not None:
       g = torch.detach(g)
       x = x + self.cond(g)
     x = self.convs(x, x_mask)
@@ -111,9 +116,11 @@ class DurationPredictor(nn.Module):
     if gin_channels != 0:
       self.cond = nn.Conv1d(gin_channels, in_channels, 1)
 
-  def forward(self, x, x_mask, g=None):
+  def forward(self, x, x_mask, g=None, g_cond=None):
     x = torch.detach(x)
-    if g is not None:
+    if g_cond is not None:
+      x = x + g_cond
+    elif g is not None:
       g = torch.detach(g)
       x = x + self.cond(g)
     x = self.conv_1(x * x_mask)
@@ -195,13 +202,15 @@ class ResidualCouplingBlock(nn.Module):
       self.flows.append(modules.ResidualCouplingLayer(channels, hidden_channels, kernel_size, dilation_rate, n_layers, gin_channels=gin_channels, mean_only=True))
       self.flows.append(modules.Flip())
 
-  def forward(self, x, x_mask, g=None, reverse=False):
+  def forward(self, x, x_mask, g=None, reverse=False, g_conds=None):
+    if g_conds is None:
+      g_conds = [None] * len(self.flows)
     if not reverse:
-      for flow in self.flows:
-        x, _ = flow(x, x_mask, g=g, reverse=reverse)
+      for flow, g_cond in zip(self.flows, g_conds):
+        x, _ = flow(x, x_mask, g=g, reverse=reverse, g_cond=g_cond)
     else:
-      for flow in reversed(self.flows):
-        x = flow(x, x_mask, g=g, reverse=reverse)
+      for flow, g_cond in zip(reversed(self.flows), reversed(g_conds)):
+        x = flow(x, x_mask, g=g, reverse=reverse, g_cond=g_cond)
     return x
 
 
@@ -263,20 +272,45 @@ class Generator(torch.nn.Module):
         if gin_channels != 0:
             self.cond = nn.Conv1d(gin_channels, upsample_initial_channel, 1)
 
-    def forward(self, x, g=None):
+        # samples per latent frame and one-sided receptive field in latent
+        # frames, used to give every window of forward_chunked enough context
+        self.upsample_factor = math.prod(upsample_rates)
+        context, rate = 3, 1 # conv_pre
+        for u, k in zip(upsample_rates, upsample_kernel_sizes):
+            context += math.ceil(k / u) / rate
+            rate *= u
+            context += max(
+                sum(get_padding(rk, d) + get_padding(rk, 1) for d in rd)
+                for rk, rd in zip(resblock_kernel_sizes, resblock_dilation_sizes)) / rate
+        context += 3 / rate # conv_post
+        self.context_frames = math.ceil(context)
+
+    def forward(self, x, g=None, g_cond=None, x_mask=None):
+        """
+        With x_mask [b, 1, t] the padded frames of a batch are zeroed before
+        every convolution, so they do not leak into the audio of the shorter
+        items: each item decodes as it would on its own.
+        """
         x = self.conv_pre(x)
-        if g is not None:
+        if g_cond is not None:
+          x = x + g_cond
+        elif g is not None:
           x = x + self.cond(g)
+        if x_mask is not None:
+          x = x * x_mask
 
         for i in range(self.num_upsamples):
             x = F.leaky_relu(x, modules.LRELU_SLOPE)
             x = self.ups[i](x)
+            if x_mask is not None:
+                x_mask = torch.repeat_interleave(x_mask, self.ups[i].stride[0], dim=2)
+                x = x * x_mask
             xs = None
             for j in range(self.num_kernels):
                 if xs is None:
-                    xs = self.resblocks[i*self.num_kernels+j](x)
+                    xs = self.resblocks[i*self.num_kernels+j](x, x_mask)
                 else:
-                    xs += self.resblocks[i*self.num_kernels+j](x)
+                    xs += self.resblocks[i*self.num_kernels+j](x, x_mask)
             x = xs / self.num_kernels
         x = F.leaky_relu(x)
         x = self.conv_post(x)
@@ -284,6 +318,22 @@ class Generator(torch.nn.Module):
 
         return x
 
+    def forward_chunked(self, x, g=None, chunk_size=32, g_cond=None):
+        """
+        Decodes x in windows of chunk_size latent frames and yields the audio
+        of every window as soon as it is ready. Each window is extended by
+        context_frames on both sides and trimmed afterwards, so the
+        concatenated output matches forward(x, g) up to float error.
+        """
+        t = x.size(2)
+        for start in range(0, t, chunk_size):
+            end = min(start + chunk_size, t)
+            ctx_start = max(start - self.context_frames, 0)
+            ctx_end = min(end + self.context_frames, t)
+            o = self.forward(x[:, :, ctx_start:ctx_end], g=g, g_cond=g_cond)
+            offset = (start - ctx_start) * self.upsample_factor
+            yield o[:, :, offset:offset + (end - start) * self.upsample_factor]
+
     def remove_weight_norm(self):
         print('Removing weight norm...')
         for l in self.ups:
@@ -386,6 +436,11 @@ class MultiPeriodDiscriminator(torch.nn.Module):
 class SynthesizerTrn(nn.Module):
   """
   Synthesizer for Training
+
+  With inference_only=True the modules that are only used for training and
+  voice conversion (the posterior encoder enc_q and the posterior flows of
+  the stochastic duration predictor) are not built. Such a model is never
+  trained, so it caches the speaker conditioning, see speaker_conditioning.
   """
 
   def __init__(self, 
@@ -408,6 +463,7 @@ class SynthesizerTrn(nn.Module):
     n_speakers=0,
     gin_channels=0,
     use_sdp=True,
+    inference_only=False,
     **kwargs):
 
     super().__init__()
@@ -431,6 +487,7 @@ class SynthesizerTrn(nn.Module):
     self.gin_channels = gin_channels
 
     self.use_sdp = use_sdp
+    self.inference_only = inference_only
 
     self.enc_p = TextEncoder(n_vocab,
         inter_channels,
@@ -441,18 +498,23 @@ class SynthesizerTrn(nn.Module):
         kernel_size,
         p_dropout)
     self.dec = Generator(inter_channels, resblock, resblock_kernel_sizes, resblock_dilation_sizes, upsample_rates, upsample_initial_channel, upsample_kernel_sizes, gin_channels=gin_channels)
-    self.enc_q = PosteriorEncoder(spec_channels, inter_channels, hidden_channels, 5, 1, 16, gin_channels=gin_channels)
+    if not inference_only:
+      self.enc_q = PosteriorEncoder(spec_channels, inter_channels, hidden_channels, 5, 1, 16, gin_channels=gin_channels)
     self.flow = ResidualCouplingBlock(inter_channels, hidden_channels, 5, 1, 4, gin_channels=gin_channels)
 
     if use_sdp:
-      self.dp = StochasticDurationPredictor(hidden_channels, 192, 3, 0.5, 4, gin_channels=gin_channels)
+      self.dp = StochasticDurationPredictor(hidden_channels, 192, 3, 0.5, 4, gin_channels=gin_channels, inference_only=inference_only)
     else:
       self.dp = DurationPredictor(hidden_channels, 256, 3, 0.5, gin_channels=gin_channels)
 
     if n_speakers > 1:
       self.emb_g = nn.Embedding(n_speakers, gin_channels)
+    self._speaker_cond = {}
 
   def forward(self, x, x_lengths, y, y_lengths, sid=None):
+    assert not self.inference_only, "Training needs a model built with inference_only=False."
+    # imported here, numba would add to the start time of the apps
+    from vits import monotonic_align
 
     x, m_p, logs_p, x_mask = self.enc_p(x, x_lengths)
     if self.n_speakers > 0:
@@ -492,33 +554,129 @@ class SynthesizerTrn(nn.Module):
     o = self.dec(z_slice, g=g)
     return o, l_length, attn, ids_slice, x_mask, y_mask, (z, z_p, m_p, logs_p, m_q, logs_q)
 
-  def infer(self, x, x_lengths, sid=None, noise_scale=1, length_scale=1, noise_scale_w=1., max_len=None):
-    x, m_p, logs_p, x_mask = self.enc_p(x, x_lengths)
-    if self.n_speakers > 0:
+  def _load_from_state_dict(self, *args, **kwargs):
+    self._speaker_cond.clear()
+    super()._load_from_state_dict(*args, **kwargs)
+
+  def _apply(self, fn, *args, **kwargs):
+    # moved or converted weights, the cached projections are stale
+    self._speaker_cond.clear()
+    return super()._apply(fn, *args, **kwargs)
+
+  def speaker_conditioning(self, sid):
+    """
+    Returns the speaker embedding g and all projections of it on the
+    inference path as a dict: 'dp' (duration predictor cond), 'flow' (the
+    cond_layer output of every coupling layer, None for the Flip modules,
+    aligned with flow.flows) and 'dec' (generator cond). They only depend
+    on the speaker, so they are computed once per speaker and cached.
+    """
+    sids = sid.tolist()
+    missing = sorted(set(sids) - self._speaker_cond.keys())
+    if missing:
+      with torch.no_grad():
+        g = self.emb_g(torch.LongTensor(missing).to(self.emb_g.weight.device)).unsqueeze(-1)
+        dp = self.dp.cond(g)
+        flow = [f.enc.cond_layer(g) if isinstance(f, modules.ResidualCouplingLayer) else None
+            for f in self.flow.flows]
+        dec = self.dec.cond(g)
+      for i, s in enumerate(missing):
+        self._speaker_cond[s] = {
+          'g': g[i:i+1],
+          'dp': dp[i:i+1],
+          'flow': [c[i:i+1] if c is not None else None for c in flow],
+          'dec': dec[i:i+1],
+        }
+
+    conds = [self._speaker_cond[s] for s in sids]
+    if len(conds) == 1:
+      return conds[0]
+    return {
+      'g': torch.cat([c['g'] for c in conds]),
+      'dp': torch.cat([c['dp'] for c in conds]),
+      'flow': [torch.cat(cs) if cs[0] is not None else None for cs in zip(*[c['flow'] for c in conds])],
+      'dec': torch.cat([c['dec'] for c in conds]),
+    }
+
+  def warm_speaker_cache(self):
+    """Fills the speaker conditioning cache for all speakers at once"""
+    self.speaker_conditioning(torch.arange(self.n_speakers))
+
+  def _infer_latent(self, x, x_lengths, sid=None, noise_scale=1, length_scale=1, noise_scale_w=1., return_attn=False):
+    with instrumentation.stage('enc_p', batch=x.size(0), symbols=x.numel()):
+      x, m_p, logs_p, x_mask = self.enc_p(x, x_lengths)
+    cond = {'dp': None, 'flow': None, 'dec': None}
+    if self.n_speakers > 0 and self.inference_only:
+      cond = self.speaker_conditioning(sid)
+      g = cond['g']
+    elif self.n_speakers > 0:
       g = self.emb_g(sid).unsqueeze(-1) # [b, h, 1]
     else:
       g = None
 
-    if self.use_sdp:
-      logw = self.dp(x, x_mask, g=g, reverse=True, noise_scale=noise_scale_w)
-    else:
-      logw = self.dp(x, x_mask, g=g)
-    w = torch.exp(logw) * x_mask * length_scale
-    w_ceil = torch.ceil(w)
-    y_lengths = torch.clamp_min(torch.sum(w_ceil, [1, 2]), 1).long()
-    y_mask = torch.unsqueeze(commons.sequence_mask(y_lengths, None), 1).to(x_mask.dtype)
-    attn_mask = torch.unsqueeze(x_mask, 2) * torch.unsqueeze(y_mask, -1)
-    attn = commons.generate_path(w_ceil, attn_mask)
-
-    m_p = torch.matmul(attn.squeeze(1), m_p.transpose(1, 2)).transpose(1, 2) # [b, t', t], [b, t, d] -> [b, d, t']
-    logs_p = torch.matmul(attn.squeeze(1), logs_p.transpose(1, 2)).transpose(1, 2) # [b, t', t], [b, t, d] -> [b, d, t']
-
-    z_p = m_p + torch.randn_like(m_p) * torch.exp(logs_p) * noise_scale
-    z = self.flow(z_p, y_mask, g=g, reverse=True)
-    o = self.dec((z * y_mask)[:,:,:max_len], g=g)
-    return o, attn, y_mask, (z, z_p, m_p, logs_p)
+    with instrumentation.stage('dp'):
+      if self.use_sdp:
+        logw = self.dp(x, x_mask, g=g, reverse=True, noise_scale=noise_scale_w, g_cond=cond['dp'])
+      else:
+        logw = self.dp(x, x_mask, g=g, g_cond=cond['dp'])
+    with instrumentation.stage('generate_path') as record:
+      w = torch.exp(logw) * x_mask * length_scale
+      w_ceil = torch.ceil(w)
+      y_lengths = torch.clamp_min(torch.sum(w_ceil, [1, 2]), 1).long()
+      y_mask = torch.unsqueeze(commons.sequence_mask(y_lengths, None), 1).to(x_mask.dtype)
+      # every frame copies the statistics of its token, the dense path is
+      # only built on request
+      indices = commons.duration_to_indices(w_ceil, y_mask.size(2)) # [b, t']
+      m_p = commons.expand_by_indices(m_p, indices) # [b, d, t] -> [b, d, t']
+      logs_p = commons.expand_by_indices(logs_p, indices) # [b, d, t] -> [b, d, t']
+      attn = None
+      if return_attn:
+        attn_mask = torch.unsqueeze(x_mask, 2) * torch.unsqueeze(y_mask, -1)
+        attn = commons.generate_path(w_ceil, attn_mask)
+      record.set(frames=y_mask.size(0) * y_mask.size(2))
+
+    with instrumentation.stage('flow'):
+      z_p = m_p + torch.randn_like(m_p) * torch.exp(logs_p) * noise_scale
+      z = self.flow(z_p, y_mask, g=g, reverse=True, g_conds=cond['flow'])
+    return z, g, cond['dec'], attn, y_mask, (z, z_p, m_p, logs_p)
+
+  def infer(self, x, x_lengths, sid=None, noise_scale=1, length_scale=1, noise_scale_w=1., max_len=None, return_attn=False):
+    """
+    Returns the audio, the alignment [b, 1, t', t] (None unless return_attn),
+    y_mask and the latents.
+    """
+    z, g, g_dec, attn, y_mask, latents = self._infer_latent(x, x_lengths, sid, noise_scale, length_scale, noise_scale_w, return_attn)
+    with instrumentation.stage('dec') as record:
+      o = self.dec((z * y_mask)[:,:,:max_len], g=g, g_cond=g_dec, x_mask=y_mask[:,:,:max_len])
+      record.set(samples=o.numel())
+    return o, attn, y_mask, latents
+
+  def infer_stream(self, x, x_lengths, sid=None, noise_scale=1, length_scale=1, noise_scale_w=1., max_len=None, chunk_size=32):
+    """
+    Same as infer, but runs the vocoder window by window and yields the
+    audio of every chunk_size latent frames as soon as it is decoded.
+    """
+    z, g, g_dec, attn, y_mask, latents = self._infer_latent(x, x_lengths, sid, noise_scale, length_scale, noise_scale_w)
+    chunks = self.dec.forward_chunked((z * y_mask)[:,:,:max_len], g=g, chunk_size=chunk_size, g_cond=g_dec)
+    while True:
+      with instrumentation.stage('dec') as record:
+        o = next(chunks, None)
+        if o is not None:
+          record.set(samples=o.numel())
+      if o is None:
+        return
+      yield o
+
+  def remove_weight_norm(self):
+    """Folds weight norm of the inference path into plain weights"""
+    self._speaker_cond.clear()
+    self.dec.remove_weight_norm()
+    for flow in self.flow.flows:
+      if isinstance(flow, modules.ResidualCouplingLayer):
+        flow.enc.remove_weight_norm()
 
   def voice_conversion(self, y, y_lengths, sid_src, sid_tgt):
+    assert not self.inference_only, "Voice conversion needs a model built with inference_only=False."
     assert self.n_speakers > 0, "n_speakers have to be larger than 0."
     g_src = self.emb_g(sid_src).unsqueeze(-1)
     g_tgt = self.emb_g(sid_tgt).unsqueeze(-1)
@@ -145,11 +145,14 @@ class WN(torch.nn.Module):
       res_skip_layer = torch.nn.utils.weight_norm(res_skip_layer, name='weight')
       self.res_skip_layers.append(res_skip_layer)
 
-  def forward(self, x, x_mask, g=None, **kwargs):
+  def forward(self, x, x_mask, g=None, g_cond=None, **kwargs):
     output = torch.zeros_like(x)
     n_channels_tensor = torch.IntTensor([self.hidden_channels])
 
-    if g is not None:
+    # g_cond is cond_layer(g) computed ahead of time
+    if g_cond is not None:
+      g = g_cond
+    elif g is not None:
       g = self.cond_layer(g)
 
     for i in range(self.n_layers):
@@ -321,10 +324,10 @@ class ResidualCouplingLayer(nn.Module):
     self.post.weight.data.zero_()
     self.post.bias.data.zero_()
 
-  def forward(self, x, x_mask, g=None, reverse=False):
+  def forward(self, x, x_mask, g=None, reverse=False, g_cond=None):
     x0, x1 = torch.split(x, [self.half_channels]*2, 1)
     h = self.pre(x0) * x_mask
-    h = self.enc(h, x_mask, g=g)
+    h = self.enc(h, x_mask, g=g, g_cond=g_cond)
     stats = self.post(h) * x_mask
     if not self.mean_only:
       m, logs = torch.split(stats, [self.half_channels]*2, 1)
@@ -379,12 +382,13 @@ class ConvFlow(nn.Module):
         unnormalized_derivatives,
         inverse=reverse,
         tails='linear',
-        tail_bound=self.tail_bound
+        tail_bound=self.tail_bound,
+        compute_logabsdet=not reverse
     )
 
     x = torch.cat([x0, x1], 1) * x_mask
-    logdet = torch.sum(logabsdet * x_mask, [1,2])
     if not reverse:
+        logdet = torch.sum(logabsdet * x_mask, [1,2])
         return x, logdet
     else:
         return x
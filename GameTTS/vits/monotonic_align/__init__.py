@@ -0,0 +1,29 @@
+import numpy as np
+import torch
+
+from vits.monotonic_align.core import maximum_path_numba, maximum_path_numpy
+
+
+def maximum_path(neg_cent, mask):
+  """
+  Monotonic alignment search.
+  neg_cent: [b, t_t, t_s]
+  mask: [b, t_t, t_s]
+  ret: [b, t_t, t_s], the path with the highest total neg_cent that assigns
+    every frame to one token, starts at the first and ends at the last one
+
+  Runs the kernel compiled with numba when numba is installed, otherwise
+  the vectorized numpy version. Both give the same paths.
+  """
+  device = neg_cent.device
+  dtype = neg_cent.dtype
+  neg_cent = neg_cent.data.cpu().numpy().astype(np.float32)
+  path = np.zeros(neg_cent.shape, dtype=np.int32)
+
+  t_t_max = mask.sum(1)[:, 0].data.cpu().numpy().astype(np.int64)
+  t_s_max = mask.sum(2)[:, 0].data.cpu().numpy().astype(np.int64)
+  if maximum_path_numba is not None:
+    maximum_path_numba(path, neg_cent, t_t_max, t_s_max)
+  else:
+    maximum_path_numpy(path, neg_cent, t_t_max, t_s_max)
+  return torch.from_numpy(path).to(device=device, dtype=dtype)
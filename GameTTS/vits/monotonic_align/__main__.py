@@ -0,0 +1,42 @@
+"""
+Times the vectorized and compiled kernels against the reference dynamic
+program: python -m vits.monotonic_align. Their equivalence is tested in
+tests/test_monotonic_align.py.
+"""
+import time
+
+import numpy as np
+
+from vits.monotonic_align.core import (
+  maximum_path_numba, maximum_path_numpy, maximum_path_reference)
+
+
+def random_batch(b, t_x, t_y, rng):
+  """neg_cent shaped scores and lengths with t_x <= t_y per item"""
+  t_xs = rng.integers(max(t_x // 2, 1), t_x + 1, size=b)
+  t_xs[0] = t_x
+  t_ys = np.maximum(t_xs * t_y // t_x - rng.integers(0, max(t_y // 10, 1), size=b), t_xs)
+  t_ys[0] = t_y
+  values = rng.standard_normal((b, t_ys.max(), t_x)).astype(np.float32) * 10
+  return values, t_ys, t_xs
+
+
+if __name__ == '__main__':
+  rng = np.random.default_rng(0)
+  kernels = [('numpy', maximum_path_numpy)]
+  if maximum_path_numba is not None:
+    kernels.append(('numba', maximum_path_numba))
+
+  # batch of 16, token and frame counts of 2 to 10 second utterances
+  for b, t_x, t_y in [(16, 64, 250), (16, 128, 500), (16, 256, 1000)]:
+    values, t_ys, t_xs = random_batch(b, t_x, t_y, rng)
+    timings = {}
+    for name, kernel in [('reference', maximum_path_reference)] + kernels:
+      runs = 1 if name == 'reference' else 5
+      kernel(np.zeros(values.shape, dtype=np.int32), values.copy(), t_ys, t_xs)
+      start = time.perf_counter()
+      for _ in range(runs):
+        kernel(np.zeros(values.shape, dtype=np.int32), values.copy(), t_ys, t_xs)
+      timings[name] = (time.perf_counter() - start) / runs * 1e3
+    print('b={} t_x={:<4} t_y={:<5} '.format(b, t_x, t_y)
+      + '  '.join('{} {:.1f}ms'.format(k, v) for k, v in timings.items()))
@@ -0,0 +1,97 @@
+import numpy as np
+
+try:
+  import numba
+except ImportError:
+  numba = None
+
+MAX_NEG_VAL = np.float32(-1e9)
+
+
+def maximum_path_each_reference(path, value, t_y, t_x, max_neg_val=-1e9):
+  """
+  The dynamic program of the original Cython core for one item, in plain
+  Python. value [t_y_max, t_x_max] float32 is overwritten with the
+  accumulated scores, path [t_y_max, t_x_max] receives the alignment.
+  """
+  index = t_x - 1
+  for y in range(t_y):
+    for x in range(max(0, t_x + y - t_y), min(t_x, y + 1)):
+      if x == y:
+        v_cur = max_neg_val
+      else:
+        v_cur = value[y - 1, x]
+      if x == 0:
+        if y == 0:
+          v_prev = 0.
+        else:
+          v_prev = max_neg_val
+      else:
+        v_prev = value[y - 1, x - 1]
+      value[y, x] += max(v_prev, v_cur)
+
+  for y in range(t_y - 1, -1, -1):
+    path[y, index] = 1
+    if index != 0 and (index == y or value[y - 1, index] < value[y - 1, index - 1]):
+      index = index - 1
+
+
+def maximum_path_reference(paths, values, t_ys, t_xs):
+  for i in range(paths.shape[0]):
+    maximum_path_each_reference(paths[i], values[i], t_ys[i], t_xs[i])
+
+
+def maximum_path_numpy(paths, values, t_ys, t_xs):
+  """
+  Same as maximum_path_reference, vectorized over the batch and the text
+  axis. Row y of the accumulated scores only depends on row y - 1, so the
+  forward pass takes one step per frame over all items and all tokens; the
+  backtracking takes one step per frame over all items. The float32
+  arithmetic per cell is the same as in the reference, so are the paths.
+  """
+  b, t_y_max, t_x_max = values.shape
+  t_ys = np.asarray(t_ys, dtype=np.int64)[:, None]
+  t_xs = np.asarray(t_xs, dtype=np.int64)[:, None]
+  x = np.arange(t_x_max)[None]
+  lower = t_xs - t_ys # cell (y, x) is reachable for lower + y <= x <= y
+  upper = np.minimum(t_xs, t_ys) # and x < t_x, y < t_y
+
+  v_prev = np.empty((b, t_x_max), dtype=np.float32)
+  for y in range(t_y_max):
+    if y == 0:
+      v_cur = np.full((b, t_x_max), MAX_NEG_VAL, dtype=np.float32)
+      v_prev[:] = MAX_NEG_VAL
+      v_prev[:, 0] = 0.
+    else:
+      v_cur = np.where(x == y, MAX_NEG_VAL, values[:, y - 1])
+      v_prev[:, 0] = MAX_NEG_VAL
+      v_prev[:, 1:] = values[:, y - 1, :-1]
+    valid = (x >= lower + y) & (x <= y) & (x < upper) & (y < t_ys)
+    values[:, y] = np.where(valid, values[:, y] + np.maximum(v_prev, v_cur), values[:, y])
+
+  batch = np.arange(b)
+  index = t_xs[:, 0] - 1
+  for y in range(t_y_max - 1, -1, -1):
+    active = y < t_ys[:, 0]
+    paths[batch[active], y, index[active]] = 1
+    if y == 0:
+      break
+    step = active & (index != 0) & (
+      (index == y) | (values[batch, y - 1, index] < values[batch, y - 1, np.maximum(index - 1, 0)]))
+    index = index - step
+
+
+if numba is not None:
+  _maximum_path_each_jit = numba.njit(nogil=True, cache=True)(maximum_path_each_reference)
+
+  @numba.njit(nogil=True, parallel=True, cache=True)
+  def _maximum_path_jit(paths, values, t_ys, t_xs):
+    for i in numba.prange(paths.shape[0]):
+      _maximum_path_each_jit(paths[i], values[i], t_ys[i], t_xs[i])
+
+  def maximum_path_numba(paths, values, t_ys, t_xs):
+    """maximum_path_reference compiled by numba, parallel over the batch"""
+    _maximum_path_jit(paths, values, np.asarray(t_ys, dtype=np.int64), np.asarray(t_xs, dtype=np.int64))
+else:
+  maximum_path_numba = None
+
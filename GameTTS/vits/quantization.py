@@ -0,0 +1,146 @@
+import argparse
+import os
+import time
+
+import torch
+from torch import nn
+
+from vits import utils
+
+
+class Conv1x1(nn.Module):
+  """
+  Pointwise Conv1d computed by an nn.Linear, so that dynamic int8
+  quantization (which only covers Linear layers) applies to it.
+  """
+  def __init__(self, conv):
+    super().__init__()
+    self.linear = nn.Linear(conv.in_channels, conv.out_channels, bias=conv.bias is not None)
+    with torch.no_grad():
+      self.linear.weight.copy_(conv.weight[:, :, 0])
+      if conv.bias is not None:
+        self.linear.bias.copy_(conv.bias)
+
+  def forward(self, x):
+    return self.linear(x.transpose(1, 2)).transpose(1, 2)
+
+
+def _is_pointwise(module):
+  return (isinstance(module, nn.Conv1d)
+      and module.kernel_size == (1,)
+      and module.stride == (1,)
+      and module.padding == (0,)
+      and module.groups == 1)
+
+
+def quantize_model(model):
+  """
+  Converts a SynthesizerTrn for int8 CPU inference, in place.
+
+  Weight norm is folded first, then every pointwise Conv1d on the inference
+  path (attention projections, WN conditioning and res/skip layers, duration
+  predictor and flow projections, ...) is swapped for an nn.Linear and
+  quantized dynamically. Convolutions with larger kernels have no dynamic
+  int8 kernel in PyTorch and stay in fp32.
+  """
+  model.remove_weight_norm()
+
+  for name in ['enc_p', 'dp', 'flow', 'dec']:
+    for parent in getattr(model, name).modules():
+      for child_name, child in parent.named_children():
+        if _is_pointwise(child):
+          setattr(parent, child_name, Conv1x1(child))
+
+  return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def quantized_checkpoint_path(checkpoint_path):
+  root, ext = os.path.splitext(str(checkpoint_path))
+  return root + '.int8' + ext
+
+
+def load_quantized_checkpoint(checkpoint_path, model):
+  """
+  Loads the int8 artifact stored next to checkpoint_path into an fp32
+  model, building and saving it first if it is missing or was made from
+  a different checkpoint or model layout.
+  """
+  quantized_path = quantized_checkpoint_path(checkpoint_path)
+  signature = utils.checkpoint_signature(checkpoint_path) + [model.inference_only]
+  if os.path.isfile(quantized_path):
+    checkpoint_dict = torch.load(quantized_path, map_location='cpu')
+    if checkpoint_dict.get('source') == signature:
+      model = quantize_model(model)
+      model.load_state_dict(checkpoint_dict['model'])
+      utils.logger.info("Loaded quantized checkpoint '{}'".format(quantized_path))
+      return model
+
+  model = utils.load_checkpoint(checkpoint_path, model)
+  model = quantize_model(model)
+  utils.logger.info("Saving quantized model to {}".format(quantized_path))
+  torch.save({'model': model.state_dict(), 'source': signature}, quantized_path)
+  return model
+
+
+CHECK_SENTENCES = [
+  "So hört sich meine Stimme an.",
+  "Hallo, willkommen im Kanal!",
+  "Der Weg zum alten Lager führt durch den dunklen Wald, sei also vorsichtig.",
+  "Ich habe keine Zeit für deine Geschichten, verschwinde!",
+]
+
+
+def _mel(synthesizer, audio):
+  from vits.mel_processing import mel_spectrogram_torch
+  data = synthesizer.hps_config.data
+  return mel_spectrogram_torch(
+      torch.from_numpy(audio).unsqueeze(0), data.filter_length, data.n_mel_channels,
+      data.sampling_rate, data.hop_length, data.win_length, data.mel_fmin, data.mel_fmax)
+
+
+def check_quality(config_path, model_path, speaker_id=0, n_runs=3):
+  """
+  Synthesizes CHECK_SENTENCES with the fp32 and the int8 model without
+  noise and reports the mean L1 log-mel distance and the speedup.
+  """
+  from vits.synthesizer import Synthesizer
+
+  # deterministic durations and latents, the models only differ by quantization
+  speech_param = {"speech_var_a": 0., "speech_var_b": 0., "speech_speed": 1.}
+  results = {}
+  audios = {}
+  for quantize in [False, True]:
+    synthesizer = Synthesizer(config_path)
+    synthesizer.enable_disable_cuda(False)
+    synthesizer.load_model(model_path, quantize=quantize)
+    text_seqs = [synthesizer.get_text(s) for s in CHECK_SENTENCES]
+
+    audios[quantize] = [synthesizer.infer_batch([s], speaker_id, speech_param)[0] for s in text_seqs]
+    start = time.perf_counter()
+    for _ in range(n_runs):
+      for seq in text_seqs:
+        synthesizer.infer_batch([seq], speaker_id, speech_param)
+    results['int8_seconds' if quantize else 'fp32_seconds'] = (time.perf_counter() - start) / n_runs
+
+  distances = []
+  for fp32_audio, int8_audio in zip(audios[False], audios[True]):
+    length = min(len(fp32_audio), len(int8_audio))
+    mel_fp32 = _mel(synthesizer, fp32_audio[:length])
+    mel_int8 = _mel(synthesizer, int8_audio[:length])
+    distances.append(torch.mean(torch.abs(mel_fp32 - mel_int8)).item())
+
+  results['mel_l1'] = sum(distances) / len(distances)
+  results['speedup'] = results['fp32_seconds'] / results['int8_seconds']
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Build the int8 model and compare it to fp32')
+  parser.add_argument('-c', '--config', type=str, default='vits/model/config.json')
+  parser.add_argument('-m', '--model', type=str, default='vits/model/G_600000.pth')
+  parser.add_argument('-s', '--speaker', type=int, default=0)
+  args = parser.parse_args()
+
+  results = check_quality(args.config, args.model, args.speaker)
+  print("fp32: {:.3f}s  int8: {:.3f}s  speedup: {:.2f}x  mel L1 distance: {:.4f}".format(
+      results['fp32_seconds'], results['int8_seconds'], results['speedup'], results['mel_l1']))
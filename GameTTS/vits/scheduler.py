@@ -0,0 +1,85 @@
+import bisect
+import threading
+
+# symbol counts, add_blank doubles the length of every phoneme sequence
+DEFAULT_BOUNDARIES = [0, 32, 64, 96, 128, 192, 256, 384, 512]
+
+
+class BucketScheduler:
+    """Forms inference batches of sequences with similar lengths.
+
+    Like data_utils.DistributedBucketSampler, lengths are sorted into the
+    buckets {x | b_i < len(x) <= b_i+1} given by boundaries, but nothing is
+    dropped: sequences longer than the last boundary share an overflow
+    bucket. Within a bucket the sequences are sorted by length and split
+    into batches of at most max_batch_size, so every batch is only padded
+    up to its own longest sequence.
+
+    The scheduler counts real and padded symbols of every batch it runs,
+    see stats.
+    """
+
+    def __init__(self, boundaries=None, max_batch_size=8):
+        self.boundaries = sorted(boundaries or DEFAULT_BOUNDARIES)
+        self.max_batch_size = max_batch_size
+
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def _bisect(self, length):
+        return max(bisect.bisect_left(self.boundaries, length) - 1, 0)
+
+    def schedule(self, lengths, max_batch_size=None):
+        """Returns batches of indices into lengths"""
+        max_batch_size = max_batch_size or self.max_batch_size
+        buckets = {}
+        for idx, length in enumerate(lengths):
+            buckets.setdefault(self._bisect(length), []).append(idx)
+
+        batches = []
+        for bucket_idx in sorted(buckets):
+            bucket = sorted(buckets[bucket_idx], key=lambda idx: lengths[idx])
+            for i in range(0, len(bucket), max_batch_size):
+                batches.append(bucket[i : i + max_batch_size])
+        return batches
+
+    def run(self, text_seqs, infer_fn, max_batch_size=None):
+        """Runs infer_fn (a list of sequences to a list of outputs) over the
+        scheduled batches and returns the outputs in the order of text_seqs."""
+        lengths = [seq.size(0) for seq in text_seqs]
+        outputs = [None] * len(text_seqs)
+        for batch in self.schedule(lengths, max_batch_size):
+            results = infer_fn([text_seqs[idx] for idx in batch])
+            self.record([lengths[idx] for idx in batch])
+            for idx, result in zip(batch, results):
+                outputs[idx] = result
+        return outputs
+
+    def record(self, batch_lengths):
+        with self._lock:
+            self._batches += 1
+            self._sequences += len(batch_lengths)
+            self._real_symbols += sum(batch_lengths)
+            self._padded_symbols += max(batch_lengths) * len(batch_lengths)
+
+    def reset_stats(self):
+        with self._lock:
+            self._batches = 0
+            self._sequences = 0
+            self._real_symbols = 0
+            self._padded_symbols = 0
+
+    def stats(self):
+        """padding_efficiency is the share of real symbols in all padded
+        batches, 1.0 means no padding at all"""
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "sequences": self._sequences,
+                "mean_batch_size": self._sequences / self._batches if self._batches else 0.0,
+                "real_symbols": self._real_symbols,
+                "padded_symbols": self._padded_symbols,
+                "padding_efficiency": (
+                    self._real_symbols / self._padded_symbols if self._padded_symbols else 1.0
+                ),
+            }
@@ -1,14 +1,24 @@
+import asyncio
+import contextlib
 import json
 import random
+import time
 
 import torch
 import numpy as np
 import pysbd
 
 from vits import commons, utils
+from vits.audio_cache import AudioCache
+from vits.export import export_inference_model, load_inference_model
+from vits.instrumentation import instrumentation
 from vits.models import SynthesizerTrn
+from vits.quantization import load_quantized_checkpoint
+from vits.scheduler import BucketScheduler
 from vits.text.symbols import symbols
 from vits.text import text_to_sequence
+from vits.text.cleaners import phoneme_cache
+from vits.text_frontend import TextFrontend, fork_available
 
 
 
@@ -17,6 +27,13 @@ class Synthesizer:
         self.hps_config = self.load_config(config_path)
         self.gen_model = None
         self.speaker_map = None
+        self.speaker_names = {}
+        self.model_path = None
+        self.model_hash = None
+        self.quantized = False
+        self.audio_cache = None
+        self.scheduler = BucketScheduler()
+        self.text_frontend = None
         self.segmenter = pysbd.Segmenter(language="de", clean=True)
         self.use_cuda = torch.cuda.is_available()
 
@@ -31,14 +48,49 @@ class Synthesizer:
     def init_speaker_map(self, speaker_path):
         with open(speaker_path) as json_file:
             self.speaker_map = json.load(json_file)
+        # reverse map for get_speaker_by_id, the first name of an id wins
+        self.speaker_names = {}
+        for key, val in self.speaker_map.items():
+            self.speaker_names.setdefault(str(val), key)
+
+    def init_phoneme_cache(self, cache_path):
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        phoneme_cache.open_disk_store(cache_path)
+
+    def init_text_frontend(self, max_workers=None):
+        """Sets up the process pool text frontend for large batch jobs, only
+        where worker processes can be forked"""
+        if fork_available():
+            self.text_frontend = TextFrontend(
+                self.hps_config.data.text_cleaners,
+                self.hps_config.data.add_blank,
+                max_workers,
+            )
+        return self.text_frontend
+
+    def init_audio_cache(self, cache_dir, max_bytes=256 * 1024 * 1024):
+        """Enables the audio cache for seeded requests, call after load_model"""
+        self.audio_cache = AudioCache(cache_dir, max_bytes)
+
+    def model_id(self):
+        """Identity of the running model for the audio cache. The checkpoint
+        hash comes from the export artifact, it is only computed here (once)
+        for models loaded without one."""
+        if self.model_hash is None:
+            self.model_hash = utils.checkpoint_sha256(self.model_path)
+        return [
+            self.model_hash,
+            self.quantized,
+            self.gen_model.inference_only,
+            self.use_cuda,
+        ]
 
     def get_speaker_by_id(self, speaker_id):
-        for key, val in self.speaker_map.items():
-            if str(speaker_id) == val:
-                return key
+        return self.speaker_names.get(str(speaker_id))
 
     def get_text(self, text):
-        text_norm = text_to_sequence(text, self.hps_config.data.text_cleaners)
+        with instrumentation.stage("cleaner", characters=len(text)):
+            text_norm = text_to_sequence(text, self.hps_config.data.text_cleaners)
         if self.hps_config.data.add_blank:
             text_norm = commons.intersperse(text_norm, 0)
         text_norm = torch.LongTensor(text_norm)
@@ -47,59 +99,247 @@ class Synthesizer:
     def load_config(self, conf_path):
         return utils.get_hparams_from_file(conf_path)
 
-    def load_model(self, model_path):
+    def load_model(self, model_path, quantize=False, inference_only=True, export=True):
+        """Builds the generator and loads its weights.
+
+        By default only the modules needed for inference are built and weight
+        norm is folded once after loading. With export=True the result is
+        exported next to the checkpoint and later starts load that artifact
+        directly, a failing export (read-only folder, full disk) only logs a
+        warning. With
+        quantize=True the model is converted for int8 CPU inference, the
+        converted weights are cached next to the checkpoint as well.
+        """
+        self.model_path = model_path
+        self.model_hash = None
+        self.quantized = quantize
+        start = time.perf_counter()
+
+        if inference_only and not quantize:
+            self.gen_model = load_inference_model(model_path)
+            if self.gen_model is not None:
+                self.model_hash = self.gen_model.checkpoint_sha256
+                _ = self.gen_model.eval()
+                if self.use_cuda:
+                    self.gen_model.cuda()
+                return
+
         self.gen_model = SynthesizerTrn(
             len(symbols),
             self.hps_config.data.filter_length // 2 + 1,
             self.hps_config.train.segment_size // self.hps_config.data.hop_length,
             n_speakers=self.hps_config.data.n_speakers,
+            inference_only=inference_only,
             **self.hps_config.model
         )
+        _ = self.gen_model.eval()
+
+        if quantize:
+            # dynamically quantized layers only run on the CPU
+            self.use_cuda = False
+            self.gen_model = load_quantized_checkpoint(model_path, self.gen_model)
+            return
+
+        _ = utils.load_checkpoint(model_path, self.gen_model)
+        if inference_only:
+            self.gen_model.remove_weight_norm()
+            if export:
+                try:
+                    build_seconds = time.perf_counter() - start
+                    self.model_hash = utils.checkpoint_sha256(model_path)
+                    export_inference_model(
+                        self.gen_model, model_path, build_seconds, self.model_hash
+                    )
+                except Exception as err:
+                    utils.logger.warning(f"Could not export the inference model: {err}")
+
         # move model to cuda
         if self.use_cuda:
             self.gen_model.cuda()
-            
-        _ = self.gen_model.eval()
-        _ = utils.load_checkpoint(model_path, self.gen_model)
 
+    def warm_speaker_cache(self):
+        """Precomputes the conditioning of all speakers, call after load_model"""
+        if self.gen_model.inference_only:
+            self.gen_model.warm_speaker_cache()
+
+    def get_batch(self, text_seqs):
+        """Right zero-pads symbol id sequences into a [b, t] batch"""
+        x_lengths = torch.LongTensor([seq.size(0) for seq in text_seqs])
+        x_padded = torch.LongTensor(len(text_seqs), int(x_lengths.max()))
+        x_padded.zero_()
+        for i, seq in enumerate(text_seqs):
+            x_padded[i, : seq.size(0)] = seq
+        return x_padded, x_lengths
+
+    def infer_batch(self, text_seqs, speaker_id=0, speech_param=None):
+        """Runs a single inference pass over all sequences and returns one
+        float32 waveform per sequence, trimmed to its own length.
+
+        speaker_id is either a single id for the whole batch or one id per
+        sequence.
+        """
+        x_tst, x_tst_lengths = self.get_batch(text_seqs)
+        if isinstance(speaker_id, (list, tuple)):
+            sid = torch.LongTensor([int(s_id) for s_id in speaker_id])
+        else:
+            sid = torch.LongTensor([int(speaker_id)] * len(text_seqs))
+
+        # move objects to cuda
+        if self.use_cuda:
+            x_tst = x_tst.cuda()
+            x_tst_lengths = x_tst_lengths.cuda()
+            sid = sid.cuda()
 
-    def synthesize(self, text, speaker_id=0, speech_param=None):
+        with torch.no_grad():
+            audio, _, y_mask, _ = self.gen_model.infer(
+                x_tst,
+                x_tst_lengths,
+                sid=sid,
+                noise_scale=float(speech_param["speech_var_a"]),
+                noise_scale_w=float(speech_param["speech_var_b"]),
+                length_scale=float(speech_param["speech_speed"]),
+            )
+            # every latent frame is upsampled to hop_length samples
+            audio_lengths = y_mask.sum([1, 2]).long() * self.hps_config.data.hop_length
+
+        audio = audio[:, 0].data.cpu().float().numpy()
+        audio_lengths = audio_lengths.cpu().tolist()
+        return [audio[i, : audio_lengths[i]] for i in range(len(text_seqs))]
+
+    @contextlib.contextmanager
+    def seeded(self, seed):
+        """Makes noise sampling and pauses inside the block reproducible.
+
+        Yields the random number generator to use for the pauses. The global
+        torch RNG state is restored afterwards.
+        """
+        if seed is None:
+            yield random
+            return
+        devices = [torch.cuda.current_device()] if self.use_cuda else []
+        with torch.random.fork_rng(devices=devices):
+            torch.manual_seed(seed)
+            yield random.Random(seed)
+
+    def synthesize(self, text, speaker_id=0, speech_param=None, batch_size=8, seed=None):
+        """Synthesizes text sentence by sentence.
+
+        Sentences of similar length, up to batch_size of them, are padded
+        into one batch and run through the model together (see
+        BucketScheduler), batch_size=None batches all sentences of a length
+        bucket at once and batch_size=1 falls back to one inference pass per
+        sentence.
+
+        With a seed the output is reproducible and, once init_audio_cache was
+        called, served from the audio cache on repeated requests.
+        """
+        with instrumentation.stage("segmenter", characters=len(text)):
+            seg_text = self.segmenter.segment(text)
+        text_seqs = [self.get_text(text) for text in seg_text]
+        batch_size = batch_size or max(len(text_seqs), 1)
+
+        cache_key = None
+        if seed is not None and self.audio_cache is not None:
+            batches = self.scheduler.schedule([seq.size(0) for seq in text_seqs], batch_size)
+            cache_key = AudioCache.make_key(
+                text_seqs, speaker_id, speech_param, seed, self.model_id(), batches
+            )
+            audio = self.audio_cache.get(cache_key)
+            if audio is not None:
+                return audio
+
+        with self.seeded(seed) as rng:
+            audios = self.scheduler.run(
+                text_seqs,
+                lambda batch: self.infer_batch(batch, speaker_id, speech_param),
+                batch_size,
+            )
+            audio = self.join_sentences(audios, rng)
+
+        if cache_key is not None:
+            self.audio_cache.put(cache_key, audio)
+        return audio
+
+    def join_sentences(self, audios, rng=random):
+        """Concatenates sentence waveforms with a short random pause in between"""
         wavs = []
-        seg_text = self.segmenter.segment(text)
-
-        for idx, text in enumerate(seg_text):
-            stn_tst = self.get_text(text)
-            with torch.no_grad():
-                x_tst_lengths = torch.LongTensor([stn_tst.size(0)])
-                sid = torch.LongTensor([int(speaker_id)])
-                
-                # move objects to cuda
-                if self.use_cuda:
-                    x_tst_lengths = x_tst_lengths.cuda()
-                    sid = sid.cuda()
-                    stn_tst = stn_tst.cuda()
-                x_tst = stn_tst.unsqueeze(0)
-
-                audio = (
-                    self.gen_model.infer(
-                        x_tst,
-                        x_tst_lengths,
-                        sid=sid,
-                        noise_scale=float(speech_param["speech_var_a"]),
-                        noise_scale_w=float(speech_param["speech_var_b"]),
-                        length_scale=float(speech_param["speech_speed"]),
-                    )[0][0, 0]
-                    .data.cpu()
-                    .float()
-                    .numpy()
-                )
+        for idx, audio in enumerate(audios):
+            wavs.append(audio)
+            if idx < len(audios) - 1:
+                wavs.append(self.get_pause(rng))
+
+        if not wavs:
+            return np.array([], dtype=np.float32)
+        return np.concatenate(wavs).astype(np.float32)
+
+    def get_pause(self, rng=random):
+        pause_range = rng.randrange(6000, 10000)
+        return np.zeros(pause_range, dtype=np.float32)
 
-            wavs += list(audio)
-            pause_range = random.randrange(6000, 10000)
+    def synthesize_stream(self, text, speaker_id=0, speech_param=None, chunk_size=None):
+        """Yields the audio of each sentence as soon as it is decoded.
+
+        Every sentence but the last carries its trailing pause, so
+        concatenating all chunks gives the same kind of output as synthesize.
+        With chunk_size set, the vocoder runs over windows of chunk_size
+        latent frames and every window is yielded as its own chunk.
+        """
+        with instrumentation.stage("segmenter", characters=len(text)):
+            seg_text = self.segmenter.segment(text)
+        for idx, sentence in enumerate(seg_text):
+            if chunk_size:
+                yield from self.infer_stream(
+                    self.get_text(sentence), speaker_id, speech_param, chunk_size
+                )
+                audio = np.array([], dtype=np.float32)
+            else:
+                audio = self.infer_batch(
+                    [self.get_text(sentence)], speaker_id, speech_param
+                )[0]
             if idx < len(seg_text) - 1:
-                wavs += [0] * pause_range
+                audio = np.concatenate([audio, self.get_pause()])
+            if audio.size:
+                yield audio.astype(np.float32)
+
+    @torch.no_grad()
+    def infer_stream(self, text_seq, speaker_id=0, speech_param=None, chunk_size=32):
+        """Yields float32 audio chunks of a single sequence while the vocoder
+        is still decoding the rest of it."""
+        x_tst = text_seq.unsqueeze(0)
+        x_tst_lengths = torch.LongTensor([text_seq.size(0)])
+        sid = torch.LongTensor([int(speaker_id)])
+
+        # move objects to cuda
+        if self.use_cuda:
+            x_tst = x_tst.cuda()
+            x_tst_lengths = x_tst_lengths.cuda()
+            sid = sid.cuda()
+
+        # no_grad as decorator is re-entered on every resume of the generator
+        chunks = self.gen_model.infer_stream(
+            x_tst,
+            x_tst_lengths,
+            sid=sid,
+            noise_scale=float(speech_param["speech_var_a"]),
+            noise_scale_w=float(speech_param["speech_var_b"]),
+            length_scale=float(speech_param["speech_speed"]),
+            chunk_size=chunk_size,
+        )
+        for chunk in chunks:
+            yield chunk[0, 0].data.cpu().float().numpy()
 
-        return np.array(wavs, dtype=np.float32)
+    async def synthesize_stream_async(
+        self, text, speaker_id=0, speech_param=None, chunk_size=None
+    ):
+        """Async variant of synthesize_stream, every chunk is synthesized
+        in the default executor so the event loop is not blocked."""
+        loop = asyncio.get_running_loop()
+        stream = self.synthesize_stream(text, speaker_id, speech_param, chunk_size)
+        while True:
+            audio = await loop.run_in_executor(None, next, stream, None)
+            if audio is None:
+                return
+            yield audio
 
     def save_audio(self, file_path, audio):
         pass
@@ -12,12 +12,28 @@ hyperparameter. Some cleaners are English-specific. You'll typically want to use
      the symbols in symbols.py to match your data).
 '''
 
+import json
 import re
 import gruut
 
+from vits.text.phoneme_cache import PhonemeCache
+
 # Regular expression matching whitespace:
 _whitespace_re = re.compile(r'\s+')
 
+# Table for str.translate to fix gruut/TTS phoneme mismatch
+_GRUUT_TRANS_TABLE = str.maketrans("g", "ɡ")
+_GRUUT_LANG = "de-de"
+_GRUUT_PHONEMIZER_ARGS = {
+    "remove_stress": True,
+    "ipa_minor_breaks": False,  # don't replace commas/semi-colons with IPA |
+    "ipa_major_breaks": False,  # don't replace periods with IPA ‖
+}
+_GRUUT_CACHE_CONFIG = json.dumps(
+    [gruut.__version__, _GRUUT_LANG, _GRUUT_PHONEMIZER_ARGS], sort_keys=True)
+
+phoneme_cache = PhonemeCache()
+
 
 def lowercase(text):
   return text.lower()
@@ -28,20 +44,18 @@ def collapse_whitespace(text):
 
 
 def gruut_cleaner(text):
-    # Table for str.translate to fix gruut/TTS phoneme mismatch
-    GRUUT_TRANS_TABLE = str.maketrans("g", "ɡ")
-    phonemizer_args = {
-        "remove_stress": True,
-        "ipa_minor_breaks": False,  # don't replace commas/semi-colons with IPA |
-        "ipa_major_breaks": False,  # don't replace periods with IPA ‖
-    }
-
-    text = lowercase(text)
+    # Phonemes only depend on the normalized sentence and the gruut settings,
+    # repeated lines are served from the phoneme cache
+    text = collapse_whitespace(lowercase(text)).strip()
+    return phoneme_cache.get_or_compute(_GRUUT_CACHE_CONFIG, text, _gruut_phonemize)
+
+
+def _gruut_phonemize(text):
     ph_list = gruut.text_to_phonemes(
         text,
-        lang="de-de",
+        lang=_GRUUT_LANG,
         return_format="word_phonemes",
-        phonemizer_args=phonemizer_args,
+        phonemizer_args=_GRUUT_PHONEMIZER_ARGS,
     )
 
     # Join and re-split to break apart dipthongs, suprasegmentals, etc.
@@ -51,7 +65,7 @@ def gruut_cleaner(text):
 
     # Fix a few phonemes
     clean_text = (
-        clean_text.translate(GRUUT_TRANS_TABLE)
+        clean_text.translate(_GRUUT_TRANS_TABLE)
         .replace(" .", ".")
         .replace(" ?", "?")
         .replace(" !", "!")
@@ -61,4 +75,4 @@ def gruut_cleaner(text):
     )
     clean_text = collapse_whitespace(clean_text)
 
-    return clean_text
\ No newline at end of file
+    return clean_text
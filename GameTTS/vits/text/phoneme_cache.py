@@ -0,0 +1,120 @@
+import contextlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class PhonemeCache():
+  """
+  Two-level cache for phonemized sentences.
+
+  Entries live in an in-process LRU and, once open_disk_store was called,
+  in a sqlite file that survives restarts. Keys are the normalized
+  sentence together with a string describing the cleaner configuration,
+  so changing the phonemizer settings never returns stale phonemes.
+  """
+  def __init__(self, maxsize=4096):
+    self.maxsize = maxsize
+    self.hits = 0
+    self.disk_hits = 0
+    self.misses = 0
+
+    self._lru = OrderedDict()
+    self._db = None
+    self._db_path = None
+    self._inherited_dbs = []
+    self._lock = threading.Lock()
+
+  def open_disk_store(self, db_path):
+    with self._lock:
+      if self._db is not None:
+        self._db.close()
+      self._db_path = db_path
+      self._db = sqlite3.connect(str(db_path), check_same_thread=False, timeout=30)
+      self._db.execute(
+          "CREATE TABLE IF NOT EXISTS phonemes "
+          "(config TEXT, text TEXT, phonemes TEXT, PRIMARY KEY (config, text))")
+      self._db.commit()
+
+  def reopen_after_fork(self):
+    """
+    Call in a forked child process. The lock and the sqlite connection
+    inherited from the parent are replaced; the old connection is kept
+    referenced but never closed, closing it would release the parent's
+    file locks.
+    """
+    self._lock = threading.Lock()
+    if self._db is not None:
+      self._inherited_dbs.append(self._db)
+      self._db = None
+      self.open_disk_store(self._db_path)
+
+  def close_disk_store(self):
+    with self._lock:
+      if self._db is not None:
+        self._db.close()
+        self._db = None
+
+  def get_or_compute(self, config, text, phonemize_fn):
+    key = (config, text)
+    with self._lock:
+      if key in self._lru:
+        self._lru.move_to_end(key)
+        self.hits += 1
+        return self._lru[key]
+
+      if self._db is not None:
+        row = self._db.execute(
+            "SELECT phonemes FROM phonemes WHERE config = ? AND text = ?", key).fetchone()
+        if row is not None:
+          self.disk_hits += 1
+          self._put(key, row[0])
+          return row[0]
+      self.misses += 1
+
+    # phonemize outside the lock, concurrent misses for the same sentence
+    # only cost a duplicate lookup
+    phonemes = phonemize_fn(text)
+
+    with self._lock:
+      self._put(key, phonemes)
+      if self._db is not None:
+        self._db.execute("INSERT OR REPLACE INTO phonemes VALUES (?, ?, ?)", (*key, phonemes))
+        self._db.commit()
+    return phonemes
+
+  def _put(self, key, phonemes):
+    self._lru[key] = phonemes
+    self._lru.move_to_end(key)
+    while len(self._lru) > self.maxsize:
+      self._lru.popitem(last=False)
+
+  def clear(self, disk=True):
+    """Empties the LRU and, with disk=True, the sqlite store"""
+    with self._lock:
+      self._lru.clear()
+      if disk and self._db is not None:
+        self._db.execute("DELETE FROM phonemes")
+        self._db.commit()
+
+  @contextlib.contextmanager
+  def detached_disk_store(self):
+    """
+    Runs the body with the in-process LRU only, the sqlite store is neither
+    read nor written and is attached again on exit.
+    """
+    with self._lock:
+      db, self._db = self._db, None
+    try:
+      yield self
+    finally:
+      with self._lock:
+        self._db = db
+
+  def stats(self):
+    return {
+        "hits": self.hits,
+        "disk_hits": self.disk_hits,
+        "misses": self.misses,
+        "size": len(self._lru),
+    }
@@ -0,0 +1,77 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pysbd
+import torch
+
+from vits import commons
+from vits.text import text_to_sequence
+from vits.text.cleaners import phoneme_cache
+
+_worker_state = {}
+
+
+def fork_available():
+    # workers have to be forked: a spawned worker would re-run the main
+    # module of the app, which loads the model (GUI) or starts the bot
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def _init_worker(cleaner_names, add_blank):
+    phoneme_cache.reopen_after_fork()
+    _worker_state["segmenter"] = pysbd.Segmenter(language="de", clean=True)
+    _worker_state["cleaner_names"] = cleaner_names
+    _worker_state["add_blank"] = add_blank
+
+
+def _text_to_sequences(text):
+    """Segments text and returns one symbol id list per sentence"""
+    sequences = []
+    for sentence in _worker_state["segmenter"].segment(text):
+        sequence = text_to_sequence(sentence, _worker_state["cleaner_names"])
+        if _worker_state["add_blank"]:
+            sequence = commons.intersperse(sequence, 0)
+        sequences.append(sequence)
+    return sequences
+
+
+class TextFrontend:
+    """Runs sentence splitting and phonemization in worker processes.
+
+    pysbd and gruut are pure Python and hold the GIL, so on a thread they
+    compete with the inference thread. map sends raw lines to a pool of
+    forked workers and yields the symbol id tensors of every line, in
+    order, as soon as they are ready, so inference on the first lines
+    overlaps with the frontend work on the following ones. The output
+    matches Synthesizer.segmenter plus Synthesizer.get_text.
+
+    The pool is started on first use and the workers share the phoneme
+    cache's disk store.
+    """
+
+    def __init__(self, cleaner_names, add_blank, max_workers=None):
+        self.cleaner_names = cleaner_names
+        self.add_blank = add_blank
+        self.max_workers = max_workers or max(multiprocessing.cpu_count() - 1, 1)
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.max_workers,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=_init_worker,
+                initargs=(self.cleaner_names, self.add_blank),
+            )
+        return self._executor
+
+    def map(self, texts, chunksize=1):
+        """Yields a list of LongTensors (one per sentence) for every text"""
+        results = self._get_executor().map(_text_to_sequences, texts, chunksize=chunksize)
+        for sequences in results:
+            yield [torch.LongTensor(sequence) for sequence in sequences]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
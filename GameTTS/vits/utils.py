@@ -1,5 +1,6 @@
 import os
 import glob
+import hashlib
 import sys
 import argparse
 import logging
@@ -9,6 +10,8 @@ import numpy as np
 from scipy.io.wavfile import read
 import torch
 
+from vits import mmap_checkpoint
+
 MATPLOTLIB_FLAG = False
 
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
@@ -17,9 +20,15 @@ logger = logging
 
 def load_checkpoint(checkpoint_path, model):
   assert os.path.isfile(checkpoint_path)
-  checkpoint_dict = torch.load(checkpoint_path, map_location='cpu')
+  # memory-mapped checkpoints are assigned as views instead of being copied
+  load_kwargs = {}
+  if mmap_checkpoint.is_mmap_checkpoint(checkpoint_path):
+    load_kwargs['assign'] = True
+    saved_state_dict = mmap_checkpoint.load_mmap_state_dict(checkpoint_path)
+  else:
+    checkpoint_dict = torch.load(checkpoint_path, map_location='cpu')
+    saved_state_dict = checkpoint_dict['model']
 
-  saved_state_dict = checkpoint_dict['model']
   if hasattr(model, 'module'):
     state_dict = model.module.state_dict()
   else:
@@ -32,14 +41,29 @@ def load_checkpoint(checkpoint_path, model):
       logger.info("%s is not in the checkpoint" % k)
       new_state_dict[k] = v
   if hasattr(model, 'module'):
-    model.module.load_state_dict(new_state_dict)
+    model.module.load_state_dict(new_state_dict, **load_kwargs)
   else:
-    model.load_state_dict(new_state_dict)
+    model.load_state_dict(new_state_dict, **load_kwargs)
   logger.info("Loaded checkpoint '{}'" .format(
     checkpoint_path))
   return model
 
 
+def checkpoint_signature(checkpoint_path):
+  """Cheap identity of a checkpoint file, used to detect stale derived artifacts"""
+  stat = os.stat(checkpoint_path)
+  return [stat.st_size, stat.st_mtime]
+
+
+def checkpoint_sha256(checkpoint_path, chunk_size=1 << 20):
+  """Content hash of a checkpoint file, reads the whole file"""
+  sha = hashlib.sha256()
+  with open(checkpoint_path, 'rb') as f:
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+      sha.update(chunk)
+  return sha.hexdigest()
+
+
 def save_checkpoint(model, checkpoint_path):
   logger.info("Saving model to {}".format(checkpoint_path))
   if hasattr(model, 'module'):